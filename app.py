@@ -20,6 +20,7 @@ def run_starship_program(code):
         runtime.execute(ast)
 
         print("🚀 Mission completed successfully!")
+        print(f"📊 {runtime.usage}")
         return runtime.output_buffer
 
     except StarshipError as e:
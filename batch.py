@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+from interpreter import StarshipRuntime
+
+
+class MissionResult:
+    def __init__(self, seed, variables, output, usage, error=None):
+        self.seed = seed
+        self.variables = variables
+        self.output = output
+        self.usage = usage
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        status = "ok" if self.ok else f"error={self.error!r}"
+        return f"MissionResult(seed={self.seed}, {status})"
+
+
+def run_one(ast, seed, options):
+    runtime = StarshipRuntime(seed=seed, **options)
+    error = None
+    try:
+        runtime.execute(ast)
+    except Exception as e:
+        error = e
+    variables = {name: entry["value"] for name, entry in runtime.variables.items()}
+    return MissionResult(seed, variables, runtime.output_buffer, runtime.usage, error)
+
+
+def run_batch(ast, seeds, max_workers=None, **options):
+    # Every run gets its own runtime; the AST is only read, so all workers
+    # share one copy.
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(run_one, ast, seed, options) for seed in seeds]
+        return [future.result() for future in futures]
@@ -0,0 +1,455 @@
+import contextlib
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import time
+from lexer import StarshipLexer
+from parser import StarshipParser
+from interpreter import StarshipRuntime
+from errors import StarshipError
+from batch import run_batch
+import linalg
+import signals
+import spill
+
+
+def parse(source):
+    return StarshipParser(StarshipLexer(source).tokenize()).parse()
+
+
+def section(ast, section_type):
+    return next(node for node in ast.children if node.type == section_type)
+
+
+def run_plan(ast, variables, **options):
+    runtime = StarshipRuntime(**options)
+    plan = section(ast, "FLIGHT_PLAN")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        runtime.execute_cargo(section(ast, "CARGO"))
+        runtime.variables.update(variables)
+        start = time.perf_counter()
+        runtime.execute_flight_plan(plan)
+        elapsed = time.perf_counter() - start
+    return elapsed, runtime
+
+
+MATRIX_MISSION = """MISSION: MatrixBoost
+    CARGO:
+        a = [] as MATRIX
+        b = [] as MATRIX
+    FLIGHT_PLAN:
+        1. BOOST a with b INTO c
+END_MISSION"""
+
+# The same product written with CONSTELLATIONs: one ORBIT iteration per
+# multiply-add, recovering (i, j, k) from a flat counter. Without
+# conditionals the mission accumulates the sum of all entries of a @ b.
+ORBIT_MISSION = """MISSION: OrbitBoost
+    CARGO:
+        t = -1 as METRIC
+        total = 0 as METRIC
+    FLIGHT_PLAN:
+        1. ORBIT cube TIMES:
+            2. DOCK t with 1 INTO t
+            3. SPLIT t with square INTO i
+            4. SPLIT t with n INTO tn
+            5. BOOST i with n INTO row
+            6. UNDOCK tn with row INTO j
+            7. BOOST tn with n INTO tnn
+            8. UNDOCK t with tnn INTO k
+            9. DOCK row with k INTO ai
+            10. BOOST k with n INTO kn
+            11. DOCK kn with j INTO bi
+            12. EXTRACT a[ai] INTO x
+            13. EXTRACT b[bi] INTO y
+            14. BOOST x with y INTO xy
+            15. DOCK total with xy INTO total
+END_MISSION"""
+
+
+def matrix_variables(size, seed=0):
+    rng = random.Random(seed)
+    a = [[rng.randint(0, 9) for _ in range(size)] for _ in range(size)]
+    b = [[rng.randint(0, 9) for _ in range(size)] for _ in range(size)]
+    return a, b
+
+
+def bench_matrix_multiply(size=512, orbit_size=12):
+    a, b = matrix_variables(size)
+    elapsed, runtime = run_plan(
+        parse(MATRIX_MISSION),
+        {
+            "a": {"value": linalg.to_bulk(a, "MATRIX", 0), "type": "MATRIX"},
+            "b": {"value": linalg.to_bulk(b, "MATRIX", 0), "type": "MATRIX"},
+        },
+    )
+    print(f"MATRIX BOOST {size}x{size}: {elapsed:.4f}s")
+
+    small_a, small_b = matrix_variables(orbit_size)
+    orbit_elapsed, orbit_runtime = run_plan(
+        parse(ORBIT_MISSION),
+        {
+            "a": {"value": sum(small_a, []), "type": "CONSTELLATION"},
+            "b": {"value": sum(small_b, []), "type": "CONSTELLATION"},
+            "n": {"value": orbit_size, "type": "METRIC"},
+            "square": {"value": orbit_size**2, "type": "METRIC"},
+            "cube": {"value": orbit_size**3, "type": "METRIC"},
+        },
+    )
+    _, check = run_plan(
+        parse(MATRIX_MISSION),
+        {
+            "a": {"value": linalg.to_bulk(small_a, "MATRIX", 0), "type": "MATRIX"},
+            "b": {"value": linalg.to_bulk(small_b, "MATRIX", 0), "type": "MATRIX"},
+        },
+    )
+    assert (
+        orbit_runtime.variables["total"]["value"] == check.variables["c"]["value"].sum()
+    )
+
+    projected = orbit_elapsed * (size / orbit_size) ** 3
+    print(
+        f"ORBIT BOOST {orbit_size}x{orbit_size}: {orbit_elapsed:.4f}s "
+        f"(projected {size}x{size}: {projected:.0f}s, "
+        f"{projected / elapsed:.0f}x slower)"
+    )
+
+
+def bench_hot_orbit(size=16):
+    a, b = matrix_variables(size)
+    variables = {
+        "a": {"value": sum(a, []), "type": "CONSTELLATION"},
+        "b": {"value": sum(b, []), "type": "CONSTELLATION"},
+        "n": {"value": size, "type": "METRIC"},
+        "square": {"value": size**2, "type": "METRIC"},
+        "cube": {"value": size**3, "type": "METRIC"},
+    }
+    ast = parse(ORBIT_MISSION)
+    interpreted, slow = run_plan(ast, dict(variables), hot_loop_threshold=0)
+    compiled, fast = run_plan(ast, dict(variables))
+    assert slow.variables == fast.variables
+    assert slow.usage.instructions == fast.usage.instructions
+    print(
+        f"ORBIT {size**3} iterations: interpreted {interpreted:.4f}s, "
+        f"compiled {compiled:.4f}s ({interpreted / compiled:.1f}x faster)"
+    )
+
+
+QUANTUM_MISSION = """MISSION: QuantumWalk
+    CARGO:
+        position = 0 as METRIC
+        path = [] as CONSTELLATION
+    QUANTUM:
+        step = UNCERTAIN(0, 2)
+    FLIGHT_PLAN:
+        1. ORBIT 20000 TIMES:
+            2. DOCK position with step INTO position
+            3. APPEND position TO path
+END_MISSION"""
+
+
+def build_description():
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    gil = (
+        "GIL enabled" if is_gil_enabled is None or is_gil_enabled() else "free-threaded"
+    )
+    return f"Python {sys.version.split()[0]}, {gil}, {os.cpu_count()} CPUs"
+
+
+def bench_batch(missions=16, size=256):
+    print(build_description())
+    a, b = matrix_variables(size)
+    workloads = {
+        "ORBIT (pure Python)": parse(QUANTUM_MISSION),
+        f"MATRIX BOOST {size}x{size} (numpy)": parse(
+            MATRIX_MISSION.replace("a = [] as MATRIX", f"a = {a} as MATRIX").replace(
+                "b = [] as MATRIX", f"b = {b} as MATRIX"
+            )
+        ),
+    }
+    for name, ast in workloads.items():
+        seeds = range(missions)
+        baseline = None
+        for workers in (1, 2, 4, 8):
+            start = time.perf_counter()
+            results = run_batch(ast, seeds, max_workers=workers, store_path=":memory:")
+            elapsed = time.perf_counter() - start
+            assert all(result.ok for result in results)
+            baseline = baseline or elapsed
+            print(
+                f"{name}, {missions} missions, {workers} threads: "
+                f"{elapsed:.3f}s ({baseline / elapsed:.2f}x)"
+            )
+
+
+ORBIT_SUM_MISSION = """MISSION: OrbitSum
+    CARGO:
+        i = 0 as METRIC
+        total = 0 as METRIC
+    FLIGHT_PLAN:
+        1. ORBIT n TIMES:
+            2. EXTRACT data[i] INTO x
+            3. DOCK total with x INTO total
+            4. DOCK i with 1 INTO i
+END_MISSION"""
+
+NATIVE_SUM_MISSION = """MISSION: NativeSum
+    CARGO:
+        total = 0 as METRIC
+    FLIGHT_PLAN:
+        1. SUM data INTO total
+END_MISSION"""
+
+# Every iteration looks up a value that is in the CONSTELLATION.
+SEARCH_MISSION = """MISSION: Search
+    CARGO:
+        key = 0 as METRIC
+        hits = 0 as METRIC
+    FLIGHT_PLAN:
+        1. ORBIT lookups TIMES:
+            2. DETECTED key IN data INTO found
+            3. DOCK hits with found INTO hits
+            4. DOCK key with 7 INTO key
+END_MISSION"""
+
+
+def bench_constellations(size=100000, lookups=2000):
+    data = {"value": list(range(size)), "type": "CONSTELLATION"}
+    variables = {"data": data, "n": {"value": size, "type": "METRIC"}}
+    orbit, slow = run_plan(parse(ORBIT_SUM_MISSION), dict(variables))
+    native, fast = run_plan(parse(NATIVE_SUM_MISSION), dict(variables))
+    assert slow.variables["total"] == fast.variables["total"]
+    print(
+        f"SUM of {size}: ORBIT {orbit:.4f}s, native {native:.6f}s "
+        f"({orbit / native:.0f}x faster)"
+    )
+
+    variables["lookups"] = {"value": lookups, "type": "METRIC"}
+    ast = parse(SEARCH_MISSION)
+    indexed, fast = run_plan(ast, dict(variables))
+    # Compare with runtimes that never build a hash index.
+    runtime = StarshipRuntime(store_path=":memory:")
+    runtime.indexes.build_after = float("inf")
+    runtime.execute_cargo(section(ast, "CARGO"))
+    runtime.variables.update(variables)
+    start = time.perf_counter()
+    runtime.execute_flight_plan(section(ast, "FLIGHT_PLAN"))
+    scanned = time.perf_counter() - start
+    assert runtime.variables["hits"] == fast.variables["hits"]
+    print(
+        f"{lookups} DETECTED lookups in {size}: linear scans {scanned:.4f}s, "
+        f"hash index {indexed:.4f}s ({scanned / indexed:.0f}x faster)"
+    )
+
+
+APPEND_MISSION = """MISSION: AppendFlood
+    CARGO:
+        n = 0 as METRIC
+        data = [] as CONSTELLATION
+        x = 0.5 as METRIC
+    FLIGHT_PLAN:
+        1. ORBIT n TIMES:
+            2. DOCK x with 0.25 INTO x
+            3. APPEND x TO data
+END_MISSION"""
+
+# A float in a CONSTELLATION costs a list slot plus the float object.
+LIST_FLOAT_BYTES = 8 + sys.getsizeof(0.5)
+
+
+def append_flood(count, budget, spill_threshold, connection):
+    # Cap the address space at its current size plus the budget, so a list
+    # that outgrows it fails the same way it would on a machine out of RAM.
+    if budget is not None:
+        with open("/proc/self/status") as handle:
+            status = dict(line.split(":", 1) for line in handle)
+        used = int(status["VmSize"].split()[0]) * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (used + budget, used + budget))
+        # Keep the mapped chunks well inside the budget.
+        spill.CHUNK_SIZE = budget // 64
+        spill.HOT_CHUNKS = 4
+    options = {"spill_threshold": spill_threshold, "store_path": ":memory:"}
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Through execute(), so the result is read the way callers read it.
+    runtime = StarshipRuntime(**options)
+    try:
+        start = time.perf_counter()
+        runtime.execute(parse(APPEND_MISSION), {"n": count})
+        elapsed = time.perf_counter() - start
+        size = len(runtime.variables["data"]["value"])
+        error = None
+    except Exception as e:
+        elapsed = size = None
+        error = e
+    # A list that used up the budget has to go before anything else is
+    # allocated, including the frames that still reference it.
+    if error is not None:
+        error.__traceback__ = None
+    runtime.close()
+    runtime = None
+    if error is not None:
+        error = f"{type(error).__name__}: {error}"
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss
+    connection.send((elapsed, size, peak * 1024, error))
+
+
+def bench_spill(budget_mb=8, ratio=10):
+    budget = budget_mb << 20
+    count = ratio * budget // LIST_FLOAT_BYTES
+    print(
+        f"APPEND {count} floats ({count * LIST_FLOAT_BYTES >> 20} MB as a list) "
+        f"with {budget_mb} MB of address space"
+    )
+    context = multiprocessing.get_context("fork")
+    variants = (
+        ("in memory, no cap", None, None),
+        ("in memory", budget, None),
+        ("spilled", budget, 1 << 16),
+    )
+    for name, cap, spill_threshold in variants:
+        # A Pipe rather than a Queue: the capped child cannot start threads.
+        receiver, sender = context.Pipe(duplex=False)
+        worker = context.Process(
+            target=append_flood, args=(count, cap, spill_threshold, sender)
+        )
+        worker.start()
+        elapsed, size, peak, error = receiver.recv()
+        worker.join()
+        if error is not None:
+            print(f"{name}: failed with {error}")
+        else:
+            print(
+                f"{name}: {elapsed:.2f}s, {size} values, "
+                f"peak RSS +{peak / (1 << 20):.1f} MB"
+            )
+
+
+REPORT_MISSION = """MISSION: Report
+    CARGO:
+        report = "" as SIGNAL
+    FLIGHT_PLAN:
+        1. ORBIT n TIMES:
+            2. DOCK report with "fragment, " INTO report
+END_MISSION"""
+
+
+def build_report(ast, fragments, **options):
+    elapsed, runtime = run_plan(
+        ast, {"n": {"value": fragments, "type": "METRIC"}}, **options
+    )
+    start = time.perf_counter()
+    size = len(str(runtime.variables["report"]["value"]))
+    return elapsed + time.perf_counter() - start, size
+
+
+def bench_signals(fragments=1000000, flat_fragments=50000):
+    ast = parse(REPORT_MISSION)
+    for name, options in (
+        ("interpreted", {"hot_loop_threshold": 0}),
+        ("compiled", {}),
+    ):
+        elapsed, size = build_report(ast, fragments, store_path=":memory:", **options)
+        print(
+            f"{fragments} DOCKs into a {size / 1e6:.0f} MB SIGNAL, {name}: "
+            f"{elapsed:.2f}s"
+        )
+
+    # Without ropes every DOCK copies the whole SIGNAL, so time grows with
+    # the square of the fragment count; measure a smaller report.
+    rope_min = signals.ROPE_MIN
+    signals.ROPE_MIN = float("inf")
+    try:
+        elapsed, size = build_report(
+            ast, flat_fragments, hot_loop_threshold=0, store_path=":memory:"
+        )
+    finally:
+        signals.ROPE_MIN = rope_min
+    estimate = elapsed * (fragments / flat_fragments) ** 2
+    print(
+        f"{flat_fragments} DOCKs with flat strings: {elapsed:.2f}s "
+        f"(~{estimate:.0f}s for {fragments})"
+    )
+
+
+class RecursiveRuntime(StarshipRuntime):
+    # The executor before ORBIT frames: every nesting level is another
+    # execute_instruction/execute_orbit call on the Python stack.
+    def execute_orbit(self, orbit_node):
+        frame = self.orbit_frame(orbit_node)
+        try:
+            while self.next_iteration(frame):
+                for instruction in frame.body[frame.position :]:
+                    self.execute_instruction(instruction)
+                frame.position = len(frame.body)
+        finally:
+            if self.recorder is not None:
+                self.recorder.end_orbit()
+
+
+def nested_mission(depth):
+    # An ORBIT takes every following step, so each "ORBIT 1 TIMES" nests the
+    # rest of the plan one level deeper.
+    steps = ["ORBIT n TIMES:"]
+    for _ in range(depth):
+        steps += ["DOCK i with 1 INTO i", "ORBIT 1 TIMES:"]
+    steps.append("DOCK i with 1 INTO i")
+    plan = "".join(f"        {k + 1}. {step}\n" for k, step in enumerate(steps))
+    return f"""MISSION: Nested
+    CARGO:
+        i = 0 as METRIC
+    FLIGHT_PLAN:
+{plan}END_MISSION"""
+
+
+def run_nested(runtime_class, ast, iterations):
+    runtime = runtime_class(store_path=":memory:")
+    runtime.execute_cargo(section(ast, "CARGO"))
+    runtime.variables["n"] = {"value": iterations, "type": "METRIC"}
+    start = time.perf_counter()
+    try:
+        runtime.execute_flight_plan(section(ast, "FLIGHT_PLAN"))
+    except StarshipError as e:
+        # The recursive executor turns RecursionError into a StarshipError.
+        return e.message
+    return time.perf_counter() - start
+
+
+def bench_nesting(depth=200, instructions=2000000, deep=100000):
+    ast = parse(nested_mission(depth))
+    iterations = instructions // (2 * depth + 1)
+    for name, runtime_class in (
+        ("recursive", RecursiveRuntime),
+        ("frame stack", StarshipRuntime),
+    ):
+        elapsed = run_nested(runtime_class, ast, iterations)
+        print(
+            f"{iterations} x {depth} nested ORBITs, {name}: {elapsed:.2f}s "
+            f"({elapsed / iterations / depth * 1e9:.0f} ns per level)"
+        )
+
+    ast = parse(nested_mission(deep))
+    for name, runtime_class in (
+        ("recursive", RecursiveRuntime),
+        ("frame stack", StarshipRuntime),
+    ):
+        elapsed = run_nested(runtime_class, ast, 1)
+        result = elapsed if isinstance(elapsed, str) else f"{elapsed:.2f}s"
+        print(f"{deep} nested ORBITs, {name}: {result}")
+
+
+BENCHMARKS = {
+    "matrix": bench_matrix_multiply,
+    "orbit": bench_hot_orbit,
+    "batch": bench_batch,
+    "constellations": bench_constellations,
+    "spill": bench_spill,
+    "signals": bench_signals,
+    "nesting": bench_nesting,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -0,0 +1,78 @@
+import math
+
+
+class QuantumBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = [0] * capacity
+        self.size = 0
+        self.head = 0
+        self.total = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.overwrites = 0
+
+    def append(self, value):
+        items = self.items
+        head = self.head
+
+        if self.size < self.capacity:
+            self.size += 1
+            self.total += value
+            delta = value - self.mean
+            self.mean += delta / self.size
+            self.m2 += delta * (value - self.mean)
+        else:
+            # Sliding-window Welford update: replace the oldest sample.
+            oldest = items[head]
+            self.total += value - oldest
+            previous_mean = self.mean
+            self.mean += (value - oldest) / self.size
+            self.m2 += (value - oldest) * (value - self.mean + oldest - previous_mean)
+            self.overwrites += 1
+
+        items[head] = value
+        self.head = 0 if head + 1 == self.capacity else head + 1
+        if self.overwrites >= self.capacity:
+            self.resync()
+
+    def resync(self):
+        # Recompute the running statistics once per window so rounding error
+        # from incremental updates cannot accumulate over long streams.
+        values = list(self)
+        self.overwrites = 0
+        if all(isinstance(value, int) for value in values):
+            self.total = sum(values)
+        else:
+            self.total = math.fsum(values)
+        self.mean = self.total / self.size
+        self.m2 = math.fsum((value - self.mean) ** 2 for value in values)
+
+    def window_sum(self):
+        return self.total
+
+    def window_mean(self):
+        return self.total / self.size
+
+    def window_variance(self):
+        return max(self.m2, 0.0) / (self.size - 1) if self.size > 1 else 0.0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        # Index 0 is the newest entry, 1 the one before it, and so on.
+        if index < 0 or index >= self.size:
+            raise IndexError(index)
+        return self.items[(self.head - 1 - index) % self.capacity]
+
+    def __iter__(self):
+        start = (self.head - self.size) % self.capacity
+        for offset in range(self.size):
+            yield self.items[(start + offset) % self.capacity]
+
+    def __str__(self):
+        return str(list(self))
+
+    def __repr__(self):
+        return f"QuantumBuffer(capacity={self.capacity}, size={self.size})"
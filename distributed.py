@@ -0,0 +1,427 @@
+import argparse
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+from collections import deque
+from multiprocessing import AuthenticationError, get_context
+from multiprocessing.connection import Listener, Client
+from errors import StarshipError
+from lexer import StarshipLexer
+from parser import StarshipParser
+from interpreter import StarshipRuntime
+from program import Program
+from batch import MissionResult
+from serialization import serialize, deserialize
+from sweep import parse_axis, grid
+
+DEFAULT_PORT = 7477
+HEARTBEAT_INTERVAL = 1.0
+HEARTBEAT_TIMEOUT = 5.0
+PREFETCH = 4
+MAX_ATTEMPTS = 3
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def read_authkey(authkey=None):
+    if authkey is None:
+        authkey = os.environ.get("STARSHIP_AUTHKEY")
+    if not authkey:
+        # Connections carry pickled data, so they are never unauthenticated.
+        raise StarshipError("Set STARSHIP_AUTHKEY to share a key with the workers", 0)
+    return authkey.encode("utf-8") if isinstance(authkey, str) else authkey
+
+
+class Task:
+    __slots__ = ("id", "digest", "overrides", "seed", "options", "attempts")
+
+    def __init__(self, task_id, digest, overrides, seed, options):
+        self.id = task_id
+        self.digest = digest
+        self.overrides = overrides
+        self.seed = seed
+        self.options = options
+        self.attempts = 0
+
+    def message(self):
+        return self.id, self.digest, self.overrides, self.seed, self.options
+
+
+class TaskResult(MissionResult):
+    def __init__(self, task, worker, seed, variables, output, usage, error=None):
+        super().__init__(seed, variables, output, usage, error)
+        self.task = task
+        self.worker = worker
+
+    def __repr__(self):
+        status = "ok" if self.ok else f"error={self.error!r}"
+        return f"TaskResult(task={self.task}, worker={self.worker!r}, {status})"
+
+
+class WorkerState:
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+        # Tasks handed out in the order the worker runs them; the first one
+        # is running, the others are waiting in its local queue.
+        self.backlog = deque()
+        self.revoked = []
+
+
+class Coordinator:
+    def __init__(
+        self,
+        address=("127.0.0.1", DEFAULT_PORT),
+        authkey=None,
+        heartbeat_timeout=HEARTBEAT_TIMEOUT,
+        max_attempts=MAX_ATTEMPTS,
+    ):
+        self.authkey = read_authkey(authkey)
+        self.listener = Listener(address, authkey=self.authkey)
+        self.address = self.listener.address
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_attempts = max_attempts
+        self.missions = {}
+        self.tasks = {}
+        self.pending = deque()
+        self.finished = set()
+        self.workers = []
+        self.results_queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.closed = False
+        self.listening = True
+        self.accepting = threading.Thread(target=self.accept, daemon=True)
+        self.accepting.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        self.shutdown()
+
+    def add_mission(self, source):
+        ast = StarshipParser(StarshipLexer(source).tokenize()).parse()
+        data = serialize(ast)
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            self.missions[digest] = data
+        return digest
+
+    def submit(self, mission, overrides=None, seed=None, **options):
+        digest = mission if mission in self.missions else self.add_mission(mission)
+        options.setdefault("store_path", ":memory:")
+        with self.lock:
+            task = Task(len(self.tasks), digest, dict(overrides or {}), seed, options)
+            self.tasks[task.id] = task
+            self.pending.append(task)
+            self.changed.notify_all()
+        return task.id
+
+    def sweep(self, source, params, **options):
+        digest = self.add_mission(source)
+        return [
+            self.submit(digest, overrides, seed=run, **options)
+            for run, overrides in enumerate(params)
+        ]
+
+    def accept(self):
+        while True:
+            try:
+                connection = self.listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                if not self.listening:
+                    return
+                # A client that failed the authkey handshake.
+                continue
+            threading.Thread(target=self.serve, args=(connection,), daemon=True).start()
+
+    def serve(self, connection):
+        worker = WorkerState(connection, None)
+        with self.lock:
+            self.workers.append(worker)
+        try:
+            while True:
+                # Any message counts as a heartbeat; a worker that stays
+                # silent past the timeout is treated as dead.
+                if not connection.poll(self.heartbeat_timeout):
+                    break
+                message = connection.recv()
+                kind = message[0]
+                if kind == "heartbeat":
+                    continue
+                if kind == "hello":
+                    worker.name = message[1]
+                    connection.send(("welcome", self.heartbeat_timeout))
+                elif kind == "request":
+                    connection.send(self.assign(worker, message[1]))
+                elif kind == "mission":
+                    with self.lock:
+                        data = self.missions[message[1]]
+                    connection.send(("mission", message[1], data))
+                elif kind == "result":
+                    revoked = self.complete(worker, message[1], message[2])
+                    connection.send(("ack", revoked))
+        except (EOFError, OSError):
+            pass
+        finally:
+            connection.close()
+            self.drop(worker)
+
+    def assign(self, worker, count):
+        with self.lock:
+            worker.backlog.clear()
+            tasks = []
+            while self.pending and len(tasks) < count:
+                tasks.append(self.pending.popleft())
+            if not tasks:
+                tasks = self.steal()
+            if not tasks:
+                if self.closed and len(self.finished) == len(self.tasks):
+                    return ("done",)
+                # Park the request briefly instead of having idle workers
+                # spin; they come straight back.
+                self.changed.wait(self.heartbeat_timeout / 4)
+                return ("wait",)
+            worker.backlog.extend(tasks)
+            return ("tasks", [task.message() for task in tasks])
+
+    def steal(self):
+        # Work stealing: take the back half of the longest local queue. The
+        # victim learns which tasks it lost from its next ack, before it
+        # starts another one.
+        victim = max(self.workers, key=lambda worker: len(worker.backlog), default=None)
+        if victim is None or len(victim.backlog) < 2:
+            return []
+        stolen = []
+        for _ in range(len(victim.backlog) // 2):
+            task = victim.backlog.pop()
+            victim.revoked.append(task.id)
+            stolen.append(task)
+        stolen.reverse()
+        return stolen
+
+    def complete(self, worker, task_id, payload):
+        with self.lock:
+            if worker.backlog and worker.backlog[0].id == task_id:
+                worker.backlog.popleft()
+            revoked, worker.revoked = worker.revoked, []
+            if task_id not in self.finished:
+                self.finish(self.tasks[task_id], worker.name, *payload)
+            return revoked
+
+    def finish(self, task, worker_name, variables, output, usage, error):
+        self.finished.add(task.id)
+        self.results_queue.put(
+            TaskResult(task.id, worker_name, task.seed, variables, output, usage, error)
+        )
+        self.changed.notify_all()
+
+    def drop(self, worker):
+        with self.lock:
+            if worker in self.workers:
+                self.workers.remove(worker)
+            # Everything the worker held, including the task it was running,
+            # goes back to the front of the queue.
+            for task in reversed(worker.backlog):
+                if task.id in self.finished:
+                    continue
+                task.attempts += 1
+                if task.attempts >= self.max_attempts:
+                    error = f"Task lost by {task.attempts} workers"
+                    self.finish(task, worker.name, {}, [], {}, error)
+                else:
+                    self.pending.appendleft(task)
+            worker.backlog.clear()
+            self.changed.notify_all()
+
+    def results(self):
+        # Results in completion order, until every submitted task is done.
+        delivered = 0
+        while True:
+            with self.lock:
+                if delivered == len(self.tasks):
+                    return
+            yield self.results_queue.get()
+            delivered += 1
+
+    def gather(self):
+        return sorted(self.results(), key=lambda result: result.task)
+
+    def close(self):
+        # No more submissions: workers are told "done" once every task has
+        # finished.
+        with self.lock:
+            self.closed = True
+            self.changed.notify_all()
+
+    def shutdown(self):
+        self.listening = False
+        self.listener.close()
+
+
+def execute_task(program, overrides, seed, options):
+    runtime = StarshipRuntime(seed=seed, **options)
+    error = None
+    try:
+        runtime.execute(program.ast, program.prepare(overrides))
+    except StarshipError as e:
+        error = e.message
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    variables = {name: entry["value"] for name, entry in runtime.variables.items()}
+    return variables, runtime.output_buffer, runtime.usage.summary(), error
+
+
+class Worker:
+    def __init__(
+        self,
+        address,
+        authkey=None,
+        name=None,
+        prefetch=PREFETCH,
+        heartbeat_interval=HEARTBEAT_INTERVAL,
+    ):
+        self.address = address
+        self.authkey = read_authkey(authkey)
+        self.name = name or f"{os.uname().nodename}:{os.getpid()}"
+        self.prefetch = prefetch
+        self.heartbeat_interval = heartbeat_interval
+        self.programs = {}
+        self.connection = None
+        self.send_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.completed = 0
+
+    def send(self, message):
+        with self.send_lock:
+            self.connection.send(message)
+
+    def request(self, message):
+        # Only this thread receives; the heartbeat thread only sends, and
+        # the coordinator answers every non-heartbeat message exactly once.
+        self.send(message)
+        return self.connection.recv()
+
+    def heartbeat(self):
+        while not self.stopped.wait(self.heartbeat_interval):
+            try:
+                self.send(("heartbeat",))
+            except OSError:
+                return
+
+    def program(self, digest):
+        program = self.programs.get(digest)
+        if program is None:
+            _, _, data = self.request(("mission", digest))
+            program = self.programs[digest] = Program(None, deserialize(data))
+        return program
+
+    def run(self):
+        self.connection = Client(self.address, authkey=self.authkey)
+        beating = threading.Thread(target=self.heartbeat, daemon=True)
+        beating.start()
+        try:
+            self.request(("hello", self.name))
+            local = deque()
+            while True:
+                if not local:
+                    reply = self.request(("request", self.prefetch))
+                    if reply[0] == "done":
+                        return self.completed
+                    if reply[0] == "wait":
+                        continue
+                    local.extend(reply[1])
+                task_id, digest, overrides, seed, options = local.popleft()
+                payload = execute_task(self.program(digest), overrides, seed, options)
+                _, revoked = self.request(("result", task_id, payload))
+                self.completed += 1
+                if revoked:
+                    revoked = set(revoked)
+                    local = deque(task for task in local if task[0] not in revoked)
+        except (EOFError, OSError):
+            # The coordinator went away.
+            return self.completed
+        finally:
+            self.stopped.set()
+            self.connection.close()
+
+
+def _run_worker(address, authkey, options):
+    Worker(address, authkey, **options).run()
+
+
+def start_local_workers(address, count, authkey=None, **options):
+    # Worker processes on this host, e.g. to try a coordinator without a
+    # cluster.
+    authkey = read_authkey(authkey)
+    context = get_context("spawn")
+    processes = [
+        context.Process(target=_run_worker, args=(address, authkey, options))
+        for _ in range(count)
+    ]
+    for process in processes:
+        process.start()
+    return processes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run Starship missions on workers connected over TCP."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    coordinator = commands.add_parser("coordinator", help="queue missions")
+    coordinator.add_argument("missions", nargs="+", help="mission source files")
+    coordinator.add_argument("--host", default="0.0.0.0")
+    coordinator.add_argument("--port", type=int, default=DEFAULT_PORT)
+    coordinator.add_argument(
+        "--grid",
+        action="append",
+        type=parse_axis,
+        default=[],
+        help="sweep every mission over name=start:stop[:step] or name=v1,...",
+    )
+    coordinator.add_argument(
+        "--local-workers", type=int, default=0, help="also start workers here"
+    )
+
+    worker = commands.add_parser("worker", help="run missions for a coordinator")
+    worker.add_argument("address", help="coordinator host:port")
+    worker.add_argument("--prefetch", type=int, default=PREFETCH)
+
+    args = parser.parse_args(argv)
+    if args.command == "worker":
+        completed = Worker(parse_address(args.address), prefetch=args.prefetch).run()
+        print(f"{completed} tasks completed")
+        return
+
+    with Coordinator((args.host, args.port)) as coordinator:
+        params = grid(**dict(args.grid)) if args.grid else [{}]
+        for path in args.missions:
+            with open(path) as handle:
+                coordinator.sweep(handle.read(), params)
+        address = ("127.0.0.1", coordinator.address[1])
+        processes = start_local_workers(address, args.local_workers)
+        print(f"Coordinator listening on {args.host}:{coordinator.address[1]}")
+        coordinator.close()
+        for result in coordinator.results():
+            record = {"task": result.task, "worker": result.worker}
+            if result.ok:
+                record["output"] = result.output
+            else:
+                record["error"] = result.error
+            print(json.dumps(record))
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,42 +2,235 @@ from typing import Dict, Any
 from parser import StarshipParser, ASTNode
 from lexer import StarshipLexer
 from errors import StarshipError
+from metering import StarshipMeter
+from submissions import (
+    StarshipSubMission,
+    LaunchCache,
+    is_pure,
+    freeze,
+    quantum_names,
+)
+from quantum import QuantumBlock, STATISTICS, stabilize
+from linalg import is_bulk, bulk_type
+import linalg
+from buffers import QuantumBuffer
+from storage import StarshipStore, DEFAULT_STORE_PATH
+from tiering import OrbitTiers
+from reductions import ConstellationIndexes, REDUCTIONS, SEARCHES
+from spill import SpillStore, SpilledConstellation
+from signals import SignalRope, dock_signals
+from snapshots import mission_units, unit_keys
+import copy
 import random
+import time
+
+CONSTELLATION_TYPES = (list, SpilledConstellation)
+
+
+class MissionReturn(Exception):
+    pass
+
+
+class OrbitFrame:
+    __slots__ = ("node", "body", "tiers", "remaining", "position", "observe")
+
+    def __init__(self, node, body, tiers, remaining):
+        self.node = node
+        self.body = body
+        self.tiers = tiers
+        self.remaining = remaining
+        # None between iterations, else the next instruction of the body.
+        self.position = None
+        self.observe = False
+
+
+def cargo_type(value):
+    if isinstance(value, QuantumBuffer):
+        return "QUANTUM_BUFFER"
+    if is_bulk(value):
+        return bulk_type(value)
+    if isinstance(value, (list, SpilledConstellation)):
+        return "CONSTELLATION"
+    if isinstance(value, (str, SignalRope)):
+        return "SIGNAL"
+    return "METRIC"
+
+
+def cargo_value(value, type_name, line):
+    if type_name == "METRIC" and not isinstance(value, (int, float)):
+        raise TypeError(f"Expected METRIC, got {type(value)}")
+    elif type_name == "SIGNAL" and not isinstance(value, str):
+        raise TypeError(f"Expected SIGNAL, got {type(value)}")
+    elif type_name == "CONSTELLATION" and not isinstance(value, list):
+        raise TypeError(f"Expected CONSTELLATION, got {type(value)}")
+    elif type_name in linalg.BULK_TYPES:
+        value = linalg.to_bulk(value, type_name, line)
+    elif type_name == "QUANTUM_BUFFER":
+        if not isinstance(value, int) or value < 1:
+            raise StarshipError(
+                f"QUANTUM_BUFFER needs a positive capacity, got {value}", line
+            )
+        value = QuantumBuffer(value)
+    return value
+
+
+def display_value(value):
+    if is_bulk(value):
+        return linalg.display(value)
+    return str(value)
 
 
 class StarshipRuntime:
-    def __init__(self):
+    def __init__(
+        self,
+        limits=None,
+        launch_cache_size=256,
+        store_path=DEFAULT_STORE_PATH,
+        profiler=None,
+        hot_loop_threshold=1000,
+        recorder=None,
+        metrics=None,
+        seed=None,
+        spill_threshold=None,
+        spill_dir=None,
+        snapshots=None,
+    ):
         self.variables: Dict[str, Any] = {}
         self.quantum_space: Dict[str, Any] = {}
         self.output_buffer = []
+        self.meter = StarshipMeter(limits)
+        self.sub_missions: Dict[str, StarshipSubMission] = {}
+        self.sub_mission_purity: Dict[str, bool] = {}
+        self.quantum_names = set()
+        self.launch_cache = LaunchCache(launch_cache_size)
+        self.store = StarshipStore(store_path)
+        self.profiler = profiler
+        self.tiers = OrbitTiers(hot_loop_threshold) if hot_loop_threshold else None
+        self.recorder = recorder
+        self.trace = None
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.orbit_progress = (0, 0)
+        self.metrics = metrics
+        self.instruction_counts = None
+        self.indexes = ConstellationIndexes()
+        self.spill = SpillStore(spill_threshold, spill_dir) if spill_threshold else None
+        self.snapshots = snapshots
+        self.resumed = 0
+
+    @property
+    def usage(self):
+        return self.meter.usage
+
+    def execute(self, ast, cargo=None):
+        self.meter.reset()
+        if self.metrics is not None:
+            self.instruction_counts = {}
+            start = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.start(self, ast)
+        if self.recorder is not None:
+            self.recorder.start(self, ast, cargo)
+        error = None
+        try:
+            if ast.type == "MISSION":
+                self.execute_mission(ast, cargo)
+            else:
+                raise Exception(f"Unknown node type: {ast.type}")
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.store.flush()
+            for entry in self.variables.values():
+                if type(entry["value"]) is SignalRope:
+                    entry["value"] = entry["value"].flat()
+            if self.spill is not None:
+                self.spill.settle()
+            if self.profiler is not None:
+                self.profiler.finish(self)
+            if self.recorder is not None:
+                self.trace = self.recorder.trace(error)
+            if self.metrics is not None:
+                self.metrics.observe_execution(self, time.perf_counter() - start)
+
+    def close(self):
+        # Spilled CONSTELLATIONs outlive execute(); this deletes their
+        # segment files.
+        if self.spill is not None:
+            self.spill.cleanup()
+
+    def count_instruction(self, node):
+        self.meter.instruction(node.line)
+        if self.profiler is not None:
+            self.profiler.tick(self, node)
+        if self.recorder is not None:
+            self.recorder.step(node)
+        counts = self.instruction_counts
+        if counts is not None:
+            counts[node.type] = counts.get(node.type, 0) + 1
+
+    def count_compiled(self, loop_body, done, position):
+        # Compiled ORBIT bodies charge the meter themselves but skip
+        # count_instruction.
+        if self.recorder is not None:
+            self.recorder.compiled(loop_body, done, position)
+        counts = self.instruction_counts
+        if counts is not None:
+            for k, node in enumerate(loop_body):
+                runs = done + 1 if k < position else done
+                if runs:
+                    counts[node.type] = counts.get(node.type, 0) + runs
+
+    def execute_mission(self, mission_node, cargo=None):
+        for node in mission_node.children:
+            if node.type == "SUB_MISSION":
+                self.sub_missions[node.value] = StarshipSubMission(node)
+        # Purity depends on every QUANTUM name the mission declares, wherever
+        # its QUANTUM section sits.
+        self.quantum_names = quantum_names(mission_node)
+        self.sub_mission_purity = {}
+
+        units = mission_units(mission_node)
+        snapshots = self.snapshots
+        if self.profiler is not None or self.recorder is not None:
+            # Both need to see every instruction of the run.
+            snapshots = None
+        if snapshots is not None:
+            keys = unit_keys(mission_node, units, cargo, self.seed, self.meter.limits)
+            self.resumed = snapshots.restore(self, keys)
 
-    def execute(self, ast):
-        if ast.type == "MISSION":
-            self.execute_mission(ast)
-        else:
-            raise Exception(f"Unknown node type: {ast.type}")
+        try:
+            for position in range(self.resumed, len(units)):
+                node = units[position]
+                if node.type == "CARGO":
+                    self.execute_cargo(node, cargo)
+                elif node.type == "QUANTUM":
+                    self.execute_quantum(node)
+                else:
+                    self.execute_step(node)
+                if snapshots is not None and keys[position] is not None:
+                    snapshots.take(self, keys[position])
+        except MissionReturn:
+            pass
 
-    def execute_mission(self, mission_node):
-        for node in mission_node.children:
-            if node.type == "CARGO":
-                self.execute_cargo(node)
-            elif node.type == "QUANTUM":
-                self.execute_quantum(node)
-            elif node.type == "FLIGHT_PLAN":
-                self.execute_flight_plan(node)
-
-    def execute_cargo(self, cargo_node):
+    def execute_cargo(self, cargo_node, preset=None):
         for item in cargo_node.children:
             name = item.value
             value_node = item.children[0]
             type_node = item.children[1]
 
-            print(
-                f"DEBUG: Cargo - name: {name}, value_node: {value_node.type}, value: {value_node.value}"
-            )
-
-            if value_node.type == "VALUE":
+            if preset is not None and name in preset:
+                value = preset[name]
+            elif value_node.type == "VALUE":
                 if (
+                    isinstance(value_node.value, ASTNode)
+                    and value_node.value.type == "NUMBERS"
+                    and type_node.value in linalg.BULK_TYPES
+                ):
+                    # to_bulk reads the packed literal without a list.
+                    value = value_node.value.value
+                elif (
                     isinstance(value_node.value, ASTNode)
                     and value_node.value.type == "ARRAY"
                 ):
@@ -49,113 +242,116 @@ class StarshipRuntime:
             else:
                 value = self.evaluate_expression(value_node)
 
-            print(f"DEBUG: Evaluated value: {value}")
             type_name = type_node.value
+            if preset is None or name not in preset:
+                value = cargo_value(value, type_name, item.line)
 
-            if type_name == "METRIC" and not isinstance(value, (int, float)):
-                raise TypeError(f"Expected METRIC, got {type(value)}")
-            elif type_name == "SIGNAL" and not isinstance(value, str):
-                raise TypeError(f"Expected SIGNAL, got {type(value)}")
-            elif type_name == "CONSTELLATION" and not isinstance(value, list):
-                raise TypeError(f"Expected CONSTELLATION, got {type(value)}")
-
+            if isinstance(value, list):
+                self.meter.constellation(len(value), item.line)
             self.variables[name] = {"value": value, "type": type_name}
 
     def execute_flight_plan(self, plan_node):
         for step in plan_node.children:
-            print(f"DEBUG: Flight plan step type: {step.type}")
-
-            if step.type == "STEP":
-                instruction = step.children[0]
-                self.execute_instruction(instruction)
-
-            elif step.type == "BEAM":
-                value = self.evaluate_expression(step.children[0])
-                self.output_buffer.append(str(value))
-
-            elif step.type == "EXTRACT":
-                print(f"DEBUG: Executing EXTRACT")
-                source = self.evaluate_expression(step.children[0])
-                target_var = step.children[1].value
-                print(f"DEBUG: EXTRACT - source: {source}, target: {target_var}")
-                self.variables[target_var] = {"value": source, "type": "METRIC"}
-
-            elif step.type == "BOOST":
-                print(f"DEBUG: Executing BOOST")
-                val1 = self.evaluate_expression(step.children[0])
-                val2 = self.evaluate_expression(step.children[1])
-                target_var = step.children[2].value
-                print(
-                    f"DEBUG: BOOST - val1: {val1}, val2: {val2}, target: {target_var}"
-                )
-                result = val1 * val2
-                print(f"DEBUG: BOOST result: {result}")
-                self.variables[target_var] = {"value": result, "type": "METRIC"}
-
-            elif step.type == "APPEND":
-                print(f"DEBUG: Executing APPEND")
-                value = self.evaluate_expression(step.children[0])
-                target_list = step.children[1].value
-                print(
-                    f"DEBUG: APPEND - value: {value}, target: {target_list}, current list: {self.variables[target_list]['value']}"
-                )
-
-                if target_list not in self.variables:
-                    raise StarshipError(f"List {target_list} not found", step.line)
-                if self.variables[target_list]["type"] != "CONSTELLATION":
-                    raise StarshipError(
-                        f"{target_list} is not a CONSTELLATION", step.line
-                    )
-
-                self.variables[target_list]["value"].append(value)
-                print(f"DEBUG: After APPEND: {self.variables[target_list]['value']}")
-
-            elif step.type == "DOCK":
-                print(f"DEBUG: Executing DOCK")
-                val1 = self.evaluate_expression(step.children[0])
-                val2 = self.evaluate_expression(step.children[1])
-                target_var = step.children[2].value
-                print(f"DEBUG: DOCK - val1: {val1}, val2: {val2}, target: {target_var}")
-                result = val1 + val2
-                print(f"DEBUG: DOCK result: {result}")
-                if (
-                    target_var not in self.variables
-                    or target_var == step.children[0].value
-                ):
-                    self.variables[target_var] = {"value": result, "type": "METRIC"}
-
-            elif step.type == "ORBIT":
-                count = self.evaluate_expression(step.children[0])
-                loop_body = step.children[1:]
-                for _ in range(count):
-                    for instruction in loop_body:
-                        self.execute_instruction(instruction)
-
-            elif step.type == "SPLIT":
-                print(f"DEBUG: Executing SPLIT")
-                val1 = self.evaluate_expression(step.children[0])
-                val2 = self.evaluate_expression(step.children[1])
-                target_var = step.children[2].value
-                print(
-                    f"DEBUG: SPLIT - val1: {val1}, val2: {val2}, target: {target_var}"
-                )
-                if val2 == 0:
-                    raise StarshipError("Cannot split by zero", step.line)
-                result = val1 // val2
-                self.variables[target_var] = {"value": result, "type": "METRIC"}
-                print(f"DEBUG: SPLIT result: {result}")
-
-            elif step.type == "UNDOCK":
-                print(f"DEBUG: Executing UNDOCK")
-                val1 = self.evaluate_expression(step.children[0])
-                val2 = self.evaluate_expression(step.children[1])
-                target_var = step.children[2].value
-                print(
-                    f"DEBUG: UNDOCK - val1: {val1}, val2: {val2}, target: {target_var}"
-                )
-                result = max(0, val1 - val2)
-                self.variables[target_var] = {"value": result, "type": "METRIC"}
-                print(f"DEBUG: UNDOCK result: {result}")
+            self.execute_step(step)
+
+    def execute_step(self, step):
+        self.count_instruction(step)
+
+        if step.type == "STEP":
+            instruction = step.children[0]
+            self.execute_instruction(instruction)
+
+        elif step.type == "BEAM":
+            value = self.evaluate_expression(step.children[0])
+            self.emit(display_value(value), step.line)
+
+        elif step.type == "EXTRACT":
+            source = self.evaluate_expression(step.children[0])
+            target_var = step.children[1].value
+            self.variables[target_var] = {
+                "value": source,
+                "type": cargo_type(source),
+            }
+
+        elif step.type == "BOOST":
+            val1 = self.evaluate_expression(step.children[0])
+            val2 = self.evaluate_expression(step.children[1])
+            target_var = step.children[2].value
+            result = self.combine("BOOST", val1, val2, step.line)
+            self.variables[target_var] = {
+                "value": result,
+                "type": cargo_type(result),
+            }
+
+        elif step.type == "APPEND":
+            value = self.evaluate_expression(step.children[0])
+            target_list = step.children[1].value
+
+            self.append_value(target_list, value, step.line)
+
+        elif step.type == "DOCK":
+            val1 = self.evaluate_signal(step.children[0])
+            val2 = self.evaluate_expression(step.children[1])
+            target_var = step.children[2].value
+            result = self.combine("DOCK", val1, val2, step.line)
+            if target_var not in self.variables or target_var == step.children[0].value:
+                self.variables[target_var] = {
+                    "value": result,
+                    "type": cargo_type(result),
+                }
+
+        elif step.type == "ORBIT":
+            self.execute_orbit(step)
+
+        elif step.type == "SPLIT":
+            val1 = self.evaluate_expression(step.children[0])
+            val2 = self.evaluate_expression(step.children[1])
+            target_var = step.children[2].value
+            result = self.combine("SPLIT", val1, val2, step.line)
+            self.variables[target_var] = {
+                "value": result,
+                "type": cargo_type(result),
+            }
+
+        elif step.type == "UNDOCK":
+            val1 = self.evaluate_expression(step.children[0])
+            val2 = self.evaluate_expression(step.children[1])
+            target_var = step.children[2].value
+            result = self.combine("UNDOCK", val1, val2, step.line)
+            self.variables[target_var] = {
+                "value": result,
+                "type": cargo_type(result),
+            }
+
+        elif step.type == "LAUNCH":
+            self.execute_launch(step)
+
+        elif step.type == "RETURN":
+            raise MissionReturn()
+
+        elif step.type == "QUANTUM_CALCULATE":
+            self.execute_quantum_calculate(step)
+
+        elif step.type == "STABILIZE":
+            self.execute_stabilize(step)
+
+        elif step.type == "STORE":
+            value = self.evaluate_expression(step.children[0])
+            self.store.put(step.value, value, step.line)
+
+        elif step.type in REDUCTIONS:
+            self.execute_reduction(step)
+
+        elif step.type in SEARCHES:
+            self.execute_search(step)
+
+    def evaluate_signal(self, expr):
+        # The left side of a DOCK keeps its rope, so a SIGNAL grown one
+        # fragment at a time is never copied.
+        if type(expr) is ASTNode and expr.type == "IDENTIFIER":
+            if expr.value not in self.quantum_space and expr.value in self.variables:
+                return self.variables[expr.value]["value"]
+        return self.evaluate_expression(expr)
 
     def evaluate_expression(self, expr):
         if isinstance(expr, (int, float, str)):
@@ -167,12 +363,25 @@ class StarshipRuntime:
                 if quantum_node.type == "UNCERTAIN":
                     min_val = self.evaluate_expression(quantum_node.children[0])
                     max_val = self.evaluate_expression(quantum_node.children[1])
-                    return random.uniform(min_val, max_val)
+                    return self.random.uniform(min_val, max_val)
                 return self.evaluate_expression(quantum_node)
-            return self.variables[expr.value]["value"]
+            value = self.variables[expr.value]["value"]
+            if type(value) is SignalRope:
+                return value.flat()
+            return value
 
         elif expr.type == "ARRAY_ACCESS":
             array = self.variables[expr.value]["value"]
+            if type(array) is SignalRope:
+                array = array.flat()
+            if is_bulk(array):
+                indices = [
+                    None if index.type == "SLICE" else self.evaluate_expression(index)
+                    for index in expr.children
+                ]
+                return linalg.extract(array, indices, expr.line)
+            if len(expr.children) != 1 or expr.children[0].type == "SLICE":
+                raise StarshipError(f"{expr.value} takes a single index", expr.line)
             index = int(self.evaluate_expression(expr.children[0]))
             if index < 0 or index >= len(array):
                 raise StarshipError(
@@ -190,132 +399,442 @@ class StarshipRuntime:
         elif expr.type == "ARRAY":
             return [self.evaluate_expression(e) for e in expr.children]
 
+        elif expr.type == "NUMBERS":
+            return expr.value.tolist()
+
+        elif expr.type == "STORED":
+            if self.recorder is not None:
+                return self.recorder.stored(expr.value, self.store)
+            return self.store.get_all(expr.value)
+
         elif expr.type == "UNCERTAIN":
             min_val = self.evaluate_expression(expr.children[0])
             max_val = self.evaluate_expression(expr.children[1])
-            return random.uniform(min_val, max_val)
+            return self.random.uniform(min_val, max_val)
 
         else:
             raise StarshipError(f"Invalid expression type: {expr.type}", expr.line)
 
     def execute_instruction(self, instruction):
         try:
-            print(f"DEBUG: Executing instruction type: {instruction.type}")
-
-            if instruction.type == "EXTRACT":
-                print(f"DEBUG: Executing EXTRACT")
-                source = self.evaluate_expression(instruction.children[0])
-                target_var = instruction.children[1].value
-                print(f"DEBUG: EXTRACT - source: {source}, target: {target_var}")
-                self.variables[target_var] = {"value": source, "type": "METRIC"}
-
-            elif instruction.type == "SPLIT":
-                print(f"DEBUG: Executing SPLIT")
-                val1 = self.evaluate_expression(instruction.children[0])
-                val2 = self.evaluate_expression(instruction.children[1])
-                target_var = instruction.children[2].value
-
-                print(
-                    f"DEBUG: SPLIT - val1: {val1}, val2: {val2}, target: {target_var}"
-                )
-                if val2 == 0:
-                    raise StarshipError("Cannot split by zero", instruction.line)
-                result = val1 // val2
-                self.variables[target_var] = {"value": result, "type": "METRIC"}
-                print(f"DEBUG: SPLIT result: {result}")
-
-            elif instruction.type == "UNDOCK":
-                print(f"DEBUG: Executing UNDOCK")
-                val1 = self.evaluate_expression(instruction.children[0])
-                val2 = self.evaluate_expression(instruction.children[1])
-                target_var = instruction.children[2].value
-                print(
-                    f"DEBUG: UNDOCK - val1: {val1}, val2: {val2}, target: {target_var}"
-                )
-                result = max(0, val1 - val2)
-                self.variables[target_var] = {"value": result, "type": "METRIC"}
-                print(f"DEBUG: UNDOCK result: {result}")
-
-            elif instruction.type == "BOOST":
-                val1 = self.evaluate_expression(instruction.children[0])
-                val2 = self.evaluate_expression(instruction.children[1])
-                target_var = instruction.children[2].value
-                print(
-                    f"DEBUG: BOOST - val1: {val1}, val2: {val2}, target: {target_var}"
-                )
-                result = val1 * val2
-                print(f"DEBUG: BOOST result: {result}")
-                self.variables[target_var] = {"value": result, "type": "METRIC"}
-
-            elif instruction.type == "APPEND":
-                value = self.evaluate_expression(instruction.children[0])
-                target_list = instruction.children[1].value
-                print(
-                    f"DEBUG: APPEND - value: {value}, target: {target_list}, current list: {self.variables[target_list]['value']}"
+            self.run_instruction(instruction)
+        except MissionReturn:
+            raise
+        except Exception as e:
+            if not isinstance(e, StarshipError):
+                raise StarshipError(str(e), instruction.line)
+            raise
+
+    def run_instruction(self, instruction):
+        self.count_instruction(instruction)
+
+        if instruction.type == "EXTRACT":
+            source = self.evaluate_expression(instruction.children[0])
+            target_var = instruction.children[1].value
+            self.variables[target_var] = {
+                "value": source,
+                "type": cargo_type(source),
+            }
+
+        elif instruction.type == "SPLIT":
+            val1 = self.evaluate_expression(instruction.children[0])
+            val2 = self.evaluate_expression(instruction.children[1])
+            target_var = instruction.children[2].value
+
+            result = self.combine("SPLIT", val1, val2, instruction.line)
+            self.variables[target_var] = {
+                "value": result,
+                "type": cargo_type(result),
+            }
+
+        elif instruction.type == "UNDOCK":
+            val1 = self.evaluate_expression(instruction.children[0])
+            val2 = self.evaluate_expression(instruction.children[1])
+            target_var = instruction.children[2].value
+            result = self.combine("UNDOCK", val1, val2, instruction.line)
+            self.variables[target_var] = {
+                "value": result,
+                "type": cargo_type(result),
+            }
+
+        elif instruction.type == "BOOST":
+            val1 = self.evaluate_expression(instruction.children[0])
+            val2 = self.evaluate_expression(instruction.children[1])
+            target_var = instruction.children[2].value
+            result = self.combine("BOOST", val1, val2, instruction.line)
+            self.variables[target_var] = {
+                "value": result,
+                "type": cargo_type(result),
+            }
+
+        elif instruction.type == "APPEND":
+            value = self.evaluate_expression(instruction.children[0])
+            target_list = instruction.children[1].value
+
+            self.append_value(target_list, value, instruction.line)
+
+        elif instruction.type == "BEAM":
+            value = self.evaluate_expression(instruction.children[0])
+            self.emit(display_value(value), instruction.line)
+
+        elif instruction.type == "ORBIT":
+            self.execute_orbit(instruction)
+
+        elif instruction.type == "DOCK":
+            val1 = self.evaluate_signal(instruction.children[0])
+            val2 = self.evaluate_expression(instruction.children[1])
+            target_var = instruction.children[2].value
+            result = self.combine("DOCK", val1, val2, instruction.line)
+            self.variables[target_var] = {
+                "value": result,
+                "type": cargo_type(result),
+            }
+
+        elif instruction.type == "UNDOCK":
+            val1 = self.evaluate_expression(instruction.children[0])
+            val2 = self.evaluate_expression(instruction.children[1])
+            target_var = instruction.children[2].value
+            if target_var not in self.variables:
+                self.variables[target_var] = {"value": 0, "type": "METRIC"}
+            result = self.combine("UNDOCK", val1, val2, instruction.line)
+            self.variables[target_var] = {
+                "value": result,
+                "type": cargo_type(result),
+            }
+
+        elif instruction.type == "SPLIT":
+            val1 = self.evaluate_expression(instruction.children[0])
+            val2 = self.evaluate_expression(instruction.children[1])
+            target_var = instruction.children[2].value
+
+            if target_var not in self.variables:
+                self.variables[target_var] = {"value": 0, "type": "METRIC"}
+            result = self.combine("SPLIT", val1, val2, instruction.line)
+
+            self.variables[target_var] = {
+                "value": result,
+                "type": cargo_type(result),
+            }
+
+        elif instruction.type == "LAUNCH":
+            self.execute_launch(instruction)
+
+        elif instruction.type == "RETURN":
+            raise MissionReturn()
+
+        elif instruction.type == "QUANTUM_CALCULATE":
+            self.execute_quantum_calculate(instruction)
+
+        elif instruction.type == "STABILIZE":
+            self.execute_stabilize(instruction)
+
+        elif instruction.type == "STORE":
+            value = self.evaluate_expression(instruction.children[0])
+            self.store.put(instruction.value, value, instruction.line)
+
+        elif instruction.type in REDUCTIONS:
+            self.execute_reduction(instruction)
+
+        elif instruction.type in SEARCHES:
+            self.execute_search(instruction)
+
+        else:
+            raise StarshipError(
+                f"Unknown instruction type: {instruction.type}", instruction.line
+            )
+
+    def execute_orbit(self, orbit_node):
+        # Nested ORBITs push a frame instead of recursing, so nesting depth is
+        # bounded by memory rather than the Python stack, and an exception is
+        # given the line of the instruction that raised it once, here.
+        frames = [self.orbit_frame(orbit_node)]
+        recorder = self.recorder
+        instruction = None
+        try:
+            while frames:
+                frame = frames[-1]
+                position = frame.position
+                if position is not None and position < len(frame.body):
+                    instruction = frame.body[position]
+                    frame.position = position + 1
+                    if instruction.type == "ORBIT":
+                        self.count_instruction(instruction)
+                        frames.append(self.orbit_frame(instruction))
+                    else:
+                        self.run_instruction(instruction)
+                    continue
+
+                instruction = frame.node if len(frames) > 1 else None
+                if not self.next_iteration(frame):
+                    frames.pop()
+                    if recorder is not None:
+                        recorder.end_orbit()
+        except (StarshipError, MissionReturn):
+            raise
+        except Exception as e:
+            if instruction is None:
+                raise
+            raise StarshipError(str(e), instruction.line)
+        finally:
+            if recorder is not None:
+                for _ in frames:
+                    recorder.end_orbit()
+
+    def orbit_frame(self, orbit_node):
+        count = int(self.evaluate_expression(orbit_node.children[0]))
+        loop_body = orbit_node.children[1:]
+        tiers = self.tiers if self.profiler is None and loop_body else None
+        if self.recorder is not None:
+            self.recorder.begin_orbit()
+        return OrbitFrame(orbit_node, loop_body, tiers, count)
+
+    def next_iteration(self, frame):
+        # Finishes the iteration that just ran, then starts the next one:
+        # whole iterations run compiled where possible, and the frame is left
+        # pointing at the first instruction still to be interpreted. Returns
+        # False once the ORBIT is done.
+        tiers = frame.tiers
+        if frame.position is not None:
+            if frame.observe and tiers:
+                tiers.observe(frame.node, self, cargo_type)
+            frame.remaining -= 1
+            if self.recorder is not None:
+                self.recorder.iteration()
+
+        while frame.remaining > 0:
+            compiled = tiers.compiled(frame.node) if tiers else None
+            if compiled is None:
+                frame.position = 0
+                frame.observe = True
+                return True
+            try:
+                done, position = compiled(self, frame.remaining)
+            except StarshipError:
+                self.count_compiled(frame.body, *self.orbit_progress)
+                raise
+            self.count_compiled(frame.body, done, position or 0)
+            frame.remaining -= done
+            if position is None and done:
+                continue
+            # A type guard failed (or the instruction budget ran out): finish
+            # this iteration in the interpreter and drop the compiled body.
+            tiers.deoptimize(frame.node)
+            frame.position = position or 0
+            frame.observe = False
+            return True
+        return False
+
+    def execute_launch(self, launch_node):
+        name = launch_node.value
+        sub_mission = self.sub_missions.get(name)
+        if sub_mission is None:
+            raise StarshipError(f"Unknown SUB_MISSION {name}", launch_node.line)
+
+        arguments = [
+            self.evaluate_expression(arg) for arg in launch_node.children[0].children
+        ]
+        targets = launch_node.children[1].children
+
+        if len(arguments) != len(sub_mission.requires):
+            raise StarshipError(
+                f"SUB_MISSION {name} requires {len(sub_mission.requires)} values, "
+                f"got {len(arguments)}",
+                launch_node.line,
+            )
+        if len(targets) > len(sub_mission.provides):
+            raise StarshipError(
+                f"SUB_MISSION {name} provides {len(sub_mission.provides)} values, "
+                f"got {len(targets)} targets",
+                launch_node.line,
+            )
+
+        pure = self.sub_mission_purity.get(name)
+        if pure is None:
+            pure = is_pure(name, self.sub_missions, self.quantum_names)
+            self.sub_mission_purity[name] = pure
+
+        key = None
+        results = None
+        usage = self.usage
+        if pure:
+            key = (name, tuple(freeze(arg) for arg in arguments))
+            cached = self.launch_cache.get(key)
+            if cached is not None:
+                results, (instructions, peak) = cached
+                limit = self.meter.limits.max_instructions
+                if limit is not None and usage.instructions + instructions > limit:
+                    # Run it, so the budget runs out at the same instruction.
+                    results = None
+                else:
+                    # A cache hit costs what running the LAUNCH would have.
+                    usage.instructions += instructions
+                    self.meter.constellation(peak, launch_node.line)
+
+        if results is None:
+            instructions = usage.instructions
+            peak = usage.peak_constellation_size
+            usage.peak_constellation_size = 0
+            try:
+                results = self.run_sub_mission(sub_mission, arguments, launch_node.line)
+            finally:
+                built = usage.peak_constellation_size
+                usage.peak_constellation_size = max(peak, built)
+            if key is not None:
+                cost = (usage.instructions - instructions, built)
+                self.launch_cache.put(key, results, cost)
+
+        for target, value in zip(targets, results):
+            self.variables[target.value] = {"value": value, "type": cargo_type(value)}
+
+    def run_sub_mission(self, sub_mission, arguments, line):
+        caller_variables = self.variables
+        self.variables = {
+            name: {"value": copy.deepcopy(value), "type": cargo_type(value)}
+            for name, value in zip(sub_mission.requires, arguments)
+        }
+
+        try:
+            for section in sub_mission.sections:
+                if section.type == "CARGO":
+                    self.execute_cargo(section)
+                elif section.type == "FLIGHT_PLAN":
+                    self.execute_flight_plan(section)
+        except MissionReturn:
+            pass
+        finally:
+            sub_variables = self.variables
+            self.variables = caller_variables
+
+        for name in sub_mission.provides:
+            if name not in sub_variables:
+                raise StarshipError(
+                    f"SUB_MISSION {sub_mission.name} did not provide {name}", line
                 )
+        return tuple(sub_variables[name]["value"] for name in sub_mission.provides)
 
-                if target_list not in self.variables:
-                    raise StarshipError(
-                        f"List {target_list} not found", instruction.line
-                    )
-                if self.variables[target_list]["type"] != "CONSTELLATION":
-                    raise StarshipError(
-                        f"{target_list} is not a CONSTELLATION", instruction.line
-                    )
-
-                self.variables[target_list]["value"].append(value)
-                print(f"DEBUG: After APPEND: {self.variables[target_list]['value']}")
-
-            elif instruction.type == "BEAM":
-                value = self.evaluate_expression(instruction.children[0])
-                self.output_buffer.append(str(value))
-
-            elif instruction.type == "ORBIT":
-                count = self.evaluate_expression(instruction.children[0])
-                loop_body = instruction.children[1:]
-                for _ in range(int(count)):
-                    for sub_instruction in loop_body:
-                        self.execute_instruction(sub_instruction)
-
-            elif instruction.type == "DOCK":
-                val1 = self.evaluate_expression(instruction.children[0])
-                val2 = self.evaluate_expression(instruction.children[1])
-                target_var = instruction.children[2].value
-                print(f"DEBUG: DOCK - val1: {val1}, val2: {val2}, target: {target_var}")
-                result = val1 + val2
-                print(f"DEBUG: DOCK result: {result}")
-                self.variables[target_var] = {"value": result, "type": "METRIC"}
-
-            elif instruction.type == "UNDOCK":
-                val1 = self.evaluate_expression(instruction.children[0])
-                val2 = self.evaluate_expression(instruction.children[1])
-                target_var = instruction.children[2].value
-                if target_var not in self.variables:
-                    self.variables[target_var] = {"value": 0, "type": "METRIC"}
-                result = max(0, val1 - val2)
-                self.variables[target_var] = {"value": result, "type": "METRIC"}
-
-            elif instruction.type == "SPLIT":
-                val1 = self.evaluate_expression(instruction.children[0])
-                val2 = self.evaluate_expression(instruction.children[1])
-                target_var = instruction.children[2].value
-
-                if target_var not in self.variables:
-                    self.variables[target_var] = {"value": 0, "type": "METRIC"}
-                if val2 == 0:
-                    raise StarshipError("Cannot split by zero", instruction.line)
-                result = val1 // val2
-
-                self.variables[target_var] = {"value": result, "type": "METRIC"}
+    def append_value(self, target_list, value, line):
+        if target_list not in self.variables:
+            raise StarshipError(f"List {target_list} not found", line)
+        target = self.variables[target_list]
 
-            else:
+        if target["type"] == "QUANTUM_BUFFER":
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
                 raise StarshipError(
-                    f"Unknown instruction type: {instruction.type}", instruction.line
+                    f"QUANTUM_BUFFER {target_list} only holds METRIC values", line
                 )
-        except Exception as e:
-            if not isinstance(e, StarshipError):
-                raise StarshipError(str(e), instruction.line)
-            raise
+            target["value"].append(value)
+            return
+
+        if target["type"] != "CONSTELLATION":
+            raise StarshipError(f"{target_list} is not a CONSTELLATION", line)
+        values = target["value"]
+        if type(values) is SpilledConstellation and not values.accepts(value):
+            kind = "integer" if values.kind is int else "float"
+            raise StarshipError(
+                f"{target_list} is stored on disk as {kind} METRICs and cannot "
+                f"hold {value!r}",
+                line,
+            )
+        values.append(value)
+        size = len(values)
+        self.meter.constellation(size, line)
+        if self.spill is not None and size > self.spill.threshold:
+            if type(values) is list:
+                self.spill_constellation(values)
+
+    def spill_constellation(self, values):
+        spilled = self.spill.spill(values)
+        if spilled is None:
+            return
+        # Every variable sharing the list switches to the disk-backed copy.
+        for entry in self.variables.values():
+            if entry["value"] is values:
+                entry["value"] = spilled
+        self.indexes.entries.pop(id(values), None)
+
+    def combine(self, op_type, val1, val2, line):
+        if type(val1) is SignalRope:
+            if op_type == "DOCK" and isinstance(val2, str):
+                return val1.dock(val2)
+            val1 = val1.flat()
+        if is_bulk(val1) or is_bulk(val2):
+            return linalg.operate(op_type, val1, val2, line)
+        if op_type == "BOOST":
+            # A CONSTELLATION times a count is metered before it is built.
+            if isinstance(val1, CONSTELLATION_TYPES) and isinstance(val2, int):
+                self.meter.constellation(len(val1) * max(val2, 0), line)
+            elif isinstance(val2, CONSTELLATION_TYPES) and isinstance(val1, int):
+                self.meter.constellation(len(val2) * max(val1, 0), line)
+            return val1 * val2
+        if op_type == "DOCK":
+            if isinstance(val1, str) and isinstance(val2, str):
+                return dock_signals(val1, val2)
+            if isinstance(val1, CONSTELLATION_TYPES) and isinstance(
+                val2, CONSTELLATION_TYPES
+            ):
+                self.meter.constellation(len(val1) + len(val2), line)
+            return val1 + val2
+        if op_type == "UNDOCK":
+            return max(0, val1 - val2)
+        if val2 == 0:
+            raise StarshipError("Cannot split by zero", line)
+        return val1 // val2
+
+    def execute_quantum_calculate(self, node):
+        samples = int(self.evaluate_expression(node.children[0]))
+        if samples <= 0:
+            raise StarshipError(
+                f"QUANTUM_CALCULATE needs a positive sample count, got {samples}",
+                node.line,
+            )
+
+        block = QuantumBlock(self, samples)
+        for step in node.children[1:]:
+            self.count_instruction(step)
+            block.execute(step)
+
+    def execute_stabilize(self, node):
+        values = self.evaluate_expression(node.children[0])
+        if not isinstance(values, (list, QuantumBuffer, SpilledConstellation)):
+            raise StarshipError("STABILIZE needs a CONSTELLATION", node.line)
+        self.assign_statistics(values, node.children[1:], node.line)
+
+    def assign_statistics(self, values, targets, line):
+        if len(targets) > len(STATISTICS):
+            raise StarshipError(
+                f"STABILIZE provides {len(STATISTICS)} values "
+                f"({', '.join(STATISTICS)}), got {len(targets)} targets",
+                line,
+            )
+        results = stabilize(values, len(targets), line)
+        for target, value in zip(targets, results):
+            self.variables[target.value] = {"value": value, "type": "METRIC"}
+
+    def execute_reduction(self, node):
+        values = self.evaluate_expression(node.children[0])
+        result = self.indexes.reduce(node.type, values, node.line)
+        self.variables[node.children[1].value] = {
+            "value": result,
+            "type": cargo_type(result),
+        }
+
+    def execute_search(self, node):
+        value = self.evaluate_expression(node.children[0])
+        values = self.evaluate_expression(node.children[1])
+        if not isinstance(
+            values, (list, QuantumBuffer, SpilledConstellation)
+        ) and not is_bulk(values):
+            raise StarshipError(f"{node.type} needs a CONSTELLATION", node.line)
+        if node.type == "SCAN" and is_bulk(values) and values.ndim != 1:
+            raise StarshipError("SCAN needs a CONSTELLATION or VECTOR", node.line)
+
+        position = self.indexes.find(values, value)
+        result = int(position >= 0) if node.type == "DETECTED" else position
+        self.variables[node.children[2].value] = {"value": result, "type": "METRIC"}
+
+    def emit(self, text, line):
+        self.meter.output(text, line)
+        self.output_buffer.append(text)
 
     def execute_quantum(self, quantum_node):
         for item in quantum_node.children:
@@ -325,9 +844,9 @@ class StarshipRuntime:
 
 
 class StarshipInterpreter:
-    def __init__(self, parser):
+    def __init__(self, parser, limits=None):
         self.parser = parser
-        self.runtime = StarshipRuntime()
+        self.runtime = StarshipRuntime(limits)
 
     def interpret(self):
         ast = self.parser.parse()
@@ -1,11 +1,121 @@
+import re
+from array import array
 from errors import StarshipError
 
+TOKEN_TYPES = (
+    "EOF",
+    "NUMBER",
+    "STRING",
+    "IDENTIFIER",
+    "TYPE",
+    "KEYWORD",
+    "PLUS",
+    "MINUS",
+    "MULTIPLY",
+    "DIVIDE",
+    "ASSIGN",
+    "LBRACKET",
+    "RBRACKET",
+    "COMMA",
+    "COLON",
+    "LPAREN",
+    "RPAREN",
+    "DOT",
+    "NUMBERS",
+)
+
+KEYWORDS = (
+    "MISSION:",
+    "CARGO:",
+    "FLIGHT_PLAN:",
+    "END_MISSION",
+    "QUANTUM:",
+    "ORBIT",
+    "BEAM",
+    "SCAN",
+    "DOCK",
+    "DETECTED",
+    "ABORT_MISSION",
+    "SUB_MISSION:",
+    "REQUIRES:",
+    "PROVIDES:",
+    "RETURN",
+    "SET",
+    "LAUNCH",
+    "NAVIGATE",
+    "TO",
+    "QUANTUM_LOOP",
+    "STORE",
+    "IN",
+    "QUANTUM_CALCULATE:",
+    "END_QUANTUM",
+    "STABILIZE",
+    "VERIFY",
+    "EXTRACT",
+    "INTO",
+    "APPEND",
+    "INITIALIZE",
+    "IF",
+    "WITH",
+    "as",
+    "TIMES:",
+    "TIMES",
+    "DISPLAY",
+    "to",
+    "with",
+    "UNDOCK",
+    "BOOST",
+    "SPLIT",
+    "SUM",
+    "MIN",
+    "MAX",
+    "SORT",
+)
+
+TYPES = (
+    "METRIC",
+    "SIGNAL",
+    "BEACON",
+    "CONSTELLATION",
+    "VECTOR",
+    "MATRIX",
+    "QUANTUM_BUFFER",
+)
+
+OPERATORS = {
+    "+": "PLUS",
+    "-": "MINUS",
+    "*": "MULTIPLY",
+    "/": "DIVIDE",
+    "=": "ASSIGN",
+    "[": "LBRACKET",
+    "]": "RBRACKET",
+    ",": "COMMA",
+    ":": "COLON",
+    "(": "LPAREN",
+    ")": "RPAREN",
+    ".": "DOT",
+}
+
+# Token types and keywords are interned to small integers so the parser can
+# compare kinds instead of strings. Keyword kinds follow the token type kinds.
+TOKEN_KINDS = {name: kind for kind, name in enumerate(TOKEN_TYPES)}
+KEYWORD_KINDS = {word: len(TOKEN_TYPES) + kind for kind, word in enumerate(KEYWORDS)}
+KIND = {**TOKEN_KINDS, **KEYWORD_KINDS}
+
+# Character sets of all-numeric array literals; the values themselves are
+# checked by int() and float().
+PACKED_INTS = re.compile(r"[0-9,\s-]*")
+PACKED_FLOATS = re.compile(r"[0-9eE.,\s+-]*")
+LOOSE_DOT = re.compile(r"\.[^0-9]|[^0-9]\.|^\.|\.$")
+
 
 class StarshipToken:
-    def __init__(self, type, value, line):
+    def __init__(self, type, value, line, kind=None):
         self.type = type
         self.value = value
         self.line = line
+        self.kind = TOKEN_KINDS[type] if kind is None else kind
 
     def __str__(self):
         return f"Token({self.type}, {self.value}, line {self.line})"
@@ -18,76 +128,9 @@ class StarshipLexer:
         self.current_char = self.text[0] if self.text else None
         self.line = 1
 
-        self.keywords = {
-            "MISSION:",
-            "CARGO:",
-            "FLIGHT_PLAN:",
-            "END_MISSION",
-            "QUANTUM:",
-            "ORBIT",
-            "BEAM",
-            "SCAN",
-            "DOCK",
-            "DETECTED",
-            "ABORT_MISSION",
-            "SUB_MISSION:",
-            "REQUIRES:",
-            "PROVIDES:",
-            "RETURN",
-            "SET",
-            "LAUNCH",
-            "NAVIGATE",
-            "TO",
-            "QUANTUM_LOOP",
-            "STORE",
-            "IN",
-            "QUANTUM_CALCULATE:",
-            "END_QUANTUM",
-            "STABILIZE",
-            "VERIFY",
-            "EXTRACT",
-            "INTO",
-            "APPEND",
-            "INITIALIZE",
-            "IF",
-            "WITH",
-            "as",
-            "TIMES:",
-            "TIMES",
-            "DISPLAY",
-            "to",
-            "with",
-            "TO",
-            "DOCK",
-            "UNDOCK",
-            "BOOST",
-            "SPLIT",
-        }
-
-        self.types = {
-            "METRIC",
-            "SIGNAL",
-            "BEACON",
-            "CONSTELLATION",
-            "VECTOR",
-            "MATRIX",
-            "QUANTUM_BUFFER",
-        }
-
-        self.operators = {
-            "+": "PLUS",
-            "-": "MINUS",
-            "*": "MULTIPLY",
-            "/": "DIVIDE",
-            "=": "ASSIGN",
-            "[": "LBRACKET",
-            "]": "RBRACKET",
-            ",": "COMMA",
-            ":": "COLON",
-            "(": "LPAREN",
-            ")": "RPAREN",
-            ".": "DOT",
-        }
+        self.keywords = set(KEYWORD_KINDS)
+        self.types = frozenset(TYPES)
+        self.operators = OPERATORS
 
     def error(self):
         raise StarshipError(f'Invalid character "{self.current_char}"', self.line)
@@ -106,11 +149,69 @@ class StarshipLexer:
             self.advance()
 
     def get_number(self):
-        result = ""
-        while self.current_char and self.current_char.isdigit():
-            result += self.current_char
-            self.advance()
-        return int(result)
+        text = self.text
+        start = pos = self.pos
+        end = len(text)
+        while pos < end and text[pos].isdigit():
+            pos += 1
+
+        # A '.' only starts a fraction when a digit follows, so step labels
+        # like "12." still lex as NUMBER DOT.
+        is_float = False
+        if pos + 1 < end and text[pos] == "." and text[pos + 1].isdigit():
+            pos += 2
+            while pos < end and text[pos].isdigit():
+                pos += 1
+            is_float = True
+        if pos < end and text[pos] in "eE":
+            exponent = pos + 1
+            if exponent < end and text[exponent] in "+-":
+                exponent += 1
+            if exponent < end and text[exponent].isdigit():
+                pos = exponent + 1
+                while pos < end and text[pos].isdigit():
+                    pos += 1
+                is_float = True
+
+        self.pos = pos
+        self.current_char = text[pos] if pos < end else None
+        if self.current_char == "\n":
+            # Counted on arrival, as advance() does.
+            self.line += 1
+        literal = text[start:pos]
+        return float(literal) if is_float else int(literal)
+
+    def get_packed_array(self):
+        # All-numeric array literals skip the per-element tokens and AST
+        # nodes and become a single packed array.
+        end = self.text.find("]", self.pos)
+        if end < 0:
+            return None
+        body = self.text[self.pos + 1 : end]
+        if not body.strip():
+            return None
+
+        items = body.split(",")
+        try:
+            if PACKED_INTS.fullmatch(body):
+                values = array("q", map(int, items))
+            elif (
+                PACKED_FLOATS.fullmatch(body)
+                and body.count("+") == body.count("e+") + body.count("E+")
+                and not LOOSE_DOT.search(body)
+                and all("." in item or "e" in item or "E" in item for item in items)
+            ):
+                values = array("d", map(float, items))
+            else:
+                return None
+        except (ValueError, OverflowError):
+            return None
+
+        end += 1
+        self.line += self.text.count("\n", self.pos + 1, end + 1)
+        self.pos = end
+        self.current_char = self.text[end] if end < len(self.text) else None
+        return values
 
     def get_identifier(self):
         result = ""
@@ -148,8 +249,10 @@ class StarshipLexer:
 
             if self.current_char.isalpha():
                 word = self.get_identifier()
-                if word in self.keywords:
-                    tokens.append(StarshipToken("KEYWORD", word, self.line))
+                if word in KEYWORD_KINDS:
+                    tokens.append(
+                        StarshipToken("KEYWORD", word, self.line, KEYWORD_KINDS[word])
+                    )
                 elif word in self.types:
                     tokens.append(StarshipToken("TYPE", word, self.line))
                 else:
@@ -160,8 +263,17 @@ class StarshipLexer:
                 tokens.append(StarshipToken("STRING", self.get_string(), self.line))
                 continue
 
-            if self.current_char in self.operators:
-                token_type = self.operators[self.current_char]
+            if self.current_char == "[" and (
+                not tokens or tokens[-1].type != "IDENTIFIER"
+            ):
+                line = self.line
+                values = self.get_packed_array()
+                if values is not None:
+                    tokens.append(StarshipToken("NUMBERS", values, line))
+                    continue
+
+            if self.current_char in OPERATORS:
+                token_type = OPERATORS[self.current_char]
                 tokens.append(StarshipToken(token_type, self.current_char, self.line))
                 self.advance()
                 continue
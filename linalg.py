@@ -0,0 +1,108 @@
+import numpy as np
+from errors import StarshipError
+
+BULK_TYPES = {"VECTOR": 1, "MATRIX": 2}
+
+
+def is_bulk(value):
+    return isinstance(value, np.ndarray)
+
+
+def bulk_type(value):
+    return "VECTOR" if value.ndim == 1 else "MATRIX"
+
+
+def to_bulk(value, type_name, line):
+    if is_bulk(value):
+        data = value.astype(np.float64)
+    elif type_name == "MATRIX" and value == []:
+        data = np.zeros((0, 0))
+    else:
+        try:
+            data = np.array(value, dtype=np.float64)
+        except (TypeError, ValueError):
+            raise StarshipError(f"Expected numeric {type_name}, got {value}", line)
+
+    if data.ndim != BULK_TYPES[type_name]:
+        raise StarshipError(f"Expected {type_name}, got {value}", line)
+    return data
+
+
+def check_shapes(val1, val2, op_type, line):
+    if is_bulk(val1) and is_bulk(val2) and val1.shape != val2.shape:
+        raise StarshipError(
+            f"Cannot {op_type} {bulk_type(val1)} of shape {val1.shape} "
+            f"with {bulk_type(val2)} of shape {val2.shape}",
+            line,
+        )
+
+
+def boost(val1, val2, line):
+    if not (is_bulk(val1) and is_bulk(val2)):
+        return val1 * val2
+    try:
+        result = val1 @ val2
+    except ValueError:
+        raise StarshipError(
+            f"Cannot BOOST {bulk_type(val1)} of shape {val1.shape} "
+            f"with {bulk_type(val2)} of shape {val2.shape}",
+            line,
+        )
+    return float(result) if result.ndim == 0 else result
+
+
+def dock(val1, val2, line):
+    check_shapes(val1, val2, "DOCK", line)
+    return val1 + val2
+
+
+def undock(val1, val2, line):
+    check_shapes(val1, val2, "UNDOCK", line)
+    # Clamped at 0 element-wise, like scalar UNDOCK.
+    return np.maximum(val1 - val2, 0.0)
+
+
+def split(val1, val2, line):
+    if is_bulk(val2):
+        raise StarshipError(f"Cannot SPLIT by a {bulk_type(val2)}", line)
+    if val2 == 0:
+        raise StarshipError("Cannot split by zero", line)
+    # Floored element-wise, like scalar SPLIT.
+    return np.floor_divide(val1, val2)
+
+
+OPERATIONS = {"BOOST": boost, "DOCK": dock, "UNDOCK": undock, "SPLIT": split}
+
+
+def operate(op_type, val1, val2, line):
+    return OPERATIONS[op_type](val1, val2, line)
+
+
+def extract(data, indices, line):
+    if len(indices) > data.ndim:
+        raise StarshipError(
+            f"{bulk_type(data)} takes at most {data.ndim} indices", line
+        )
+
+    key = []
+    for axis, index in enumerate(indices):
+        if index is None:
+            key.append(slice(None))
+            continue
+        index = int(index)
+        if index < 0 or index >= data.shape[axis]:
+            raise StarshipError(
+                f"Index {index} out of range for {bulk_type(data)} "
+                f"of shape {data.shape}",
+                line,
+            )
+        key.append(index)
+
+    result = data[tuple(key)]
+    if is_bulk(result):
+        return result.copy()
+    return float(result)
+
+
+def display(value):
+    return str(value.tolist())
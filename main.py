@@ -1,8 +1,8 @@
+import os
 import streamlit as st
-from lexer import StarshipLexer
-from parser import StarshipParser
-from interpreter import StarshipRuntime
 from errors import StarshipError
+from metrics import StarshipMetrics, serve
+from snapshots import SnapshotCache
 
 FACTORIAL_EXAMPLE = """MISSION: FactorialCalculator
 
@@ -98,20 +98,27 @@ ARRAY_EXAMPLE = """MISSION: ArrayManipulator
 END_MISSION"""
 
 
-def run_starship_program(code):
-    try:
-        lexer = StarshipLexer(code)
-        tokens = lexer.tokenize()
+@st.cache_resource
+def starship_metrics():
+    metrics = StarshipMetrics()
+    port = os.environ.get("STARSHIP_METRICS_PORT")
+    if port:
+        serve(metrics, int(port))
+    return metrics
 
-        parser = StarshipParser(tokens)
-        ast = parser.parse()
 
-        runtime = StarshipRuntime()
-        runtime.execute(ast)
+@st.cache_resource
+def snapshot_cache():
+    return SnapshotCache()
+
+
+def run_starship_program(code):
+    try:
+        runtime = starship_metrics().run(code, snapshots=snapshot_cache())
 
         output = ["🚀 Mission completed successfully!"]
         output.extend(runtime.output_buffer)
-        print(output)
+        output.append(f"📊 {runtime.usage}")
         return "\n\n".join(str(line) for line in output)
 
     except StarshipError as e:
@@ -202,6 +209,8 @@ END_MISSION"""
     x = 0 as METRIC         # Number (int/float)
     msg = "hello" as SIGNAL # String
     arr = [] as CONSTELLATION # Array
+    v = [1, 2] as VECTOR    # Numeric vector
+    m = [[1, 2], [3, 4]] as MATRIX # Numeric matrix
     """
     )
 
@@ -213,12 +222,30 @@ END_MISSION"""
     """
     )
 
+    st.sidebar.subheader("Sub-Missions")
+    st.sidebar.code(
+        """
+    SUB_MISSION: name       # Reusable computation
+        REQUIRES: a, b      # Inputs
+        PROVIDES: c         # Outputs
+        FLIGHT_PLAN:
+            <numbered steps>
+    END_MISSION
+    LAUNCH name with x, y INTO z  # Call it
+    RETURN                  # Leave early
+    """
+    )
+
     st.sidebar.subheader("Quantum Operations")
     st.sidebar.code(
         """
     QUANTUM:
         x = UNCERTAIN(min, max)  # Random float
     EXTRACT x INTO target    # Get random value
+    QUANTUM_CALCULATE: n     # Run body over n samples
+        <arithmetic steps>
+        STABILIZE v INTO mean, variance
+    END_QUANTUM
     """
     )
 
@@ -0,0 +1,61 @@
+from errors import StarshipError
+
+
+class StarshipLimits:
+    def __init__(
+        self, max_instructions=None, max_constellation_size=None, max_output_bytes=None
+    ):
+        self.max_instructions = max_instructions
+        self.max_constellation_size = max_constellation_size
+        self.max_output_bytes = max_output_bytes
+
+
+class StarshipUsage:
+    def __init__(self):
+        self.instructions = 0
+        self.peak_constellation_size = 0
+        self.output_bytes = 0
+
+    def summary(self):
+        return {
+            "instructions": self.instructions,
+            "peak_constellation_size": self.peak_constellation_size,
+            "output_bytes": self.output_bytes,
+        }
+
+    def __str__(self):
+        return (
+            f"Usage(instructions={self.instructions}, "
+            f"peak_constellation_size={self.peak_constellation_size}, "
+            f"output_bytes={self.output_bytes})"
+        )
+
+
+class StarshipMeter:
+    def __init__(self, limits=None):
+        self.limits = limits if limits else StarshipLimits()
+        self.usage = StarshipUsage()
+
+    def reset(self):
+        self.usage = StarshipUsage()
+
+    def instruction(self, line):
+        self.usage.instructions += 1
+        limit = self.limits.max_instructions
+        if limit is not None and self.usage.instructions > limit:
+            raise StarshipError(f"Instruction budget of {limit} exceeded", line)
+
+    def constellation(self, size, line):
+        if size > self.usage.peak_constellation_size:
+            self.usage.peak_constellation_size = size
+            limit = self.limits.max_constellation_size
+            if limit is not None and size > limit:
+                raise StarshipError(
+                    f"CONSTELLATION size limit of {limit} elements exceeded", line
+                )
+
+    def output(self, text, line):
+        self.usage.output_bytes += len(text.encode("utf-8"))
+        limit = self.limits.max_output_bytes
+        if limit is not None and self.usage.output_bytes > limit:
+            raise StarshipError(f"Output limit of {limit} bytes exceeded", line)
@@ -0,0 +1,216 @@
+import contextlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from errors import StarshipError
+from lexer import StarshipLexer
+from parser import StarshipParser
+from interpreter import StarshipRuntime
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+OUTCOMES = ("success", "error", "failure")
+PHASES = ("lex", "parse", "execute")
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def escape(text):
+    return text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def add_all(self, amounts):
+        # One lock round-trip for a whole run's worth of per-label counts.
+        with self.lock:
+            for label_values, amount in amounts:
+                self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        for label_values, value in values:
+            yield self.name, format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * len(self.buckets), 0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self.lock:
+            series = sorted(
+                (labels, (list(counts), total, count))
+                for labels, (counts, total, count) in self.series.items()
+            )
+        names = self.labels + ("le",)
+        for label_values, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                labels = format_labels(names, label_values + (format_value(bound),))
+                yield self.name + "_bucket", labels, cumulative
+            labels = format_labels(names, label_values + ("+Inf",))
+            yield self.name + "_bucket", labels, count
+            labels = format_labels(self.labels, label_values)
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, count
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class StarshipMetrics:
+    def __init__(self, registry=None):
+        self.registry = registry if registry is not None else MetricsRegistry()
+        register = self.registry.register
+        self.runs = register(
+            Counter("starship_runs_total", "Missions run, by outcome.", ["outcome"])
+        )
+        self.phases = register(
+            Histogram(
+                "starship_phase_seconds",
+                "Time spent lexing, parsing and executing missions.",
+                ["phase"],
+            )
+        )
+        self.instructions = register(
+            Counter(
+                "starship_instructions_total",
+                "Instructions executed, by instruction type.",
+                ["instruction"],
+            )
+        )
+        self.output_bytes = register(
+            Counter("starship_output_bytes_total", "Bytes written to DISPLAY.")
+        )
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.observe(time.perf_counter() - start, name)
+
+    def observe_execution(self, runtime, seconds):
+        self.phases.observe(seconds, "execute")
+        self.instructions.add_all(
+            ((instruction,), count)
+            for instruction, count in runtime.instruction_counts.items()
+        )
+        self.output_bytes.inc(runtime.usage.output_bytes)
+
+    def observe_outcome(self, error=None):
+        if error is None:
+            outcome = "success"
+        elif isinstance(error, StarshipError):
+            outcome = "error"
+        else:
+            outcome = "failure"
+        self.runs.inc(1, outcome)
+
+    def run(self, code, **options):
+        runtime = None
+        try:
+            with self.phase("lex"):
+                tokens = StarshipLexer(code).tokenize()
+            with self.phase("parse"):
+                ast = StarshipParser(tokens).parse()
+            runtime = StarshipRuntime(metrics=self, **options)
+            runtime.execute(ast)
+        except Exception as e:
+            self.observe_outcome(e)
+            raise
+        self.observe_outcome()
+        return runtime
+
+    def render(self):
+        return self.registry.render()
+
+
+def serve(metrics, port=9464, host="127.0.0.1"):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
@@ -1,6 +1,88 @@
+import gc
+import threading
 from dataclasses import dataclass
 from typing import List, Any
 from errors import StarshipError
+from lexer import KIND
+
+T_EOF = KIND["EOF"]
+T_NUMBER = KIND["NUMBER"]
+T_STRING = KIND["STRING"]
+T_IDENTIFIER = KIND["IDENTIFIER"]
+T_MINUS = KIND["MINUS"]
+T_ASSIGN = KIND["ASSIGN"]
+T_LBRACKET = KIND["LBRACKET"]
+T_RBRACKET = KIND["RBRACKET"]
+T_COMMA = KIND["COMMA"]
+T_COLON = KIND["COLON"]
+T_LPAREN = KIND["LPAREN"]
+T_RPAREN = KIND["RPAREN"]
+T_DOT = KIND["DOT"]
+T_NUMBERS = KIND["NUMBERS"]
+
+KW_MISSION = KIND["MISSION:"]
+KW_CARGO = KIND["CARGO:"]
+KW_QUANTUM = KIND["QUANTUM:"]
+KW_FLIGHT_PLAN = KIND["FLIGHT_PLAN:"]
+KW_END_MISSION = KIND["END_MISSION"]
+KW_BEAM = KIND["BEAM"]
+KW_ORBIT = KIND["ORBIT"]
+KW_DOCK = KIND["DOCK"]
+KW_UNDOCK = KIND["UNDOCK"]
+KW_BOOST = KIND["BOOST"]
+KW_SPLIT = KIND["SPLIT"]
+KW_EXTRACT = KIND["EXTRACT"]
+KW_APPEND = KIND["APPEND"]
+KW_INTO = KIND["INTO"]
+KW_TO = KIND["TO"]
+KW_TIMES = KIND["TIMES"]
+KW_TIMES_COLON = KIND["TIMES:"]
+KW_DISPLAY = KIND["DISPLAY"]
+KW_AS = KIND["as"]
+KW_LOWER_TO = KIND["to"]
+KW_LOWER_WITH = KIND["with"]
+KW_SUB_MISSION = KIND["SUB_MISSION:"]
+KW_REQUIRES = KIND["REQUIRES:"]
+KW_PROVIDES = KIND["PROVIDES:"]
+KW_LAUNCH = KIND["LAUNCH"]
+KW_RETURN = KIND["RETURN"]
+KW_QUANTUM_CALCULATE = KIND["QUANTUM_CALCULATE:"]
+KW_END_QUANTUM = KIND["END_QUANTUM"]
+KW_STABILIZE = KIND["STABILIZE"]
+KW_STORE = KIND["STORE"]
+KW_IN = KIND["IN"]
+KW_SUM = KIND["SUM"]
+KW_MIN = KIND["MIN"]
+KW_MAX = KIND["MAX"]
+KW_SORT = KIND["SORT"]
+KW_DETECTED = KIND["DETECTED"]
+KW_SCAN = KIND["SCAN"]
+
+
+class CollectorPause:
+    # The cyclic collector is process-wide, so concurrent parses share one
+    # pause: the first to start disables it and the last to finish restores
+    # whatever state it found.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.depth = 0
+        self.was_enabled = False
+
+    def __enter__(self):
+        with self.lock:
+            if self.depth == 0:
+                self.was_enabled = gc.isenabled()
+                gc.disable()
+            self.depth += 1
+
+    def __exit__(self, *exc_info):
+        with self.lock:
+            self.depth -= 1
+            if self.depth == 0 and self.was_enabled:
+                gc.enable()
+
+
+paused_gc = CollectorPause()
 
 
 @dataclass
@@ -20,8 +102,32 @@ class ASTNode:
 class StarshipParser:
     def __init__(self, tokens):
         self.tokens = tokens
+        self.token_count = len(tokens)
         self.pos = 0
         self.current_token = tokens[0] if tokens else None
+        self.kind = self.current_token.kind if self.current_token else T_EOF
+
+        self.commands = {
+            KW_BEAM: self.parse_beam_command,
+            KW_ORBIT: self.parse_orbit_command,
+            KW_DOCK: lambda: self.parse_operation_command("DOCK"),
+            KW_UNDOCK: lambda: self.parse_operation_command("UNDOCK"),
+            KW_BOOST: lambda: self.parse_operation_command("BOOST"),
+            KW_SPLIT: lambda: self.parse_operation_command("SPLIT"),
+            KW_EXTRACT: self.parse_extract_command,
+            KW_APPEND: self.parse_append_command,
+            KW_LAUNCH: self.parse_launch_command,
+            KW_RETURN: self.parse_return_command,
+            KW_QUANTUM_CALCULATE: self.parse_quantum_calculate_command,
+            KW_STABILIZE: self.parse_stabilize_command,
+            KW_STORE: self.parse_store_command,
+            KW_SUM: lambda: self.parse_reduction_command("SUM"),
+            KW_MIN: lambda: self.parse_reduction_command("MIN"),
+            KW_MAX: lambda: self.parse_reduction_command("MAX"),
+            KW_SORT: lambda: self.parse_reduction_command("SORT"),
+            KW_DETECTED: lambda: self.parse_search_command("DETECTED"),
+            KW_SCAN: lambda: self.parse_search_command("SCAN"),
+        }
 
     def error(self, message="Invalid syntax"):
         token_info = (
@@ -32,16 +138,21 @@ class StarshipParser:
 
     def advance(self):
         self.pos += 1
-        if self.pos >= len(self.tokens):
-            self.current_token = None
+        if self.pos < self.token_count:
+            self.current_token = token = self.tokens[self.pos]
+            self.kind = token.kind
         else:
-            self.current_token = self.tokens[self.pos]
+            self.current_token = None
+            self.kind = T_EOF
 
     def parse(self):
-        return self.parse_mission()
+        # The AST is many small long-lived objects; pausing the cyclic
+        # collector while building it avoids repeated full-heap scans.
+        with paused_gc:
+            return self.parse_mission()
 
     def parse_mission(self):
-        if self.current_token.value != "MISSION:":
+        if self.kind != KW_MISSION:
             self.error("Program must start with MISSION:")
 
         self.advance()
@@ -52,16 +163,18 @@ class StarshipParser:
         found_end_mission = False
 
         while self.current_token:
-            if self.current_token.value == "END_MISSION":
+            if self.kind == KW_END_MISSION:
                 found_end_mission = True
                 break
 
-            if self.current_token.value == "CARGO:":
+            if self.kind == KW_CARGO:
                 nodes.append(self.parse_cargo())
-            elif self.current_token.value == "QUANTUM:":
+            elif self.kind == KW_QUANTUM:
                 nodes.append(self.parse_quantum())
-            elif self.current_token.value == "FLIGHT_PLAN:":
+            elif self.kind == KW_FLIGHT_PLAN:
                 nodes.append(self.parse_flight_plan())
+            elif self.kind == KW_SUB_MISSION:
+                nodes.append(self.parse_sub_mission())
             else:
                 self.advance()
 
@@ -71,21 +184,62 @@ class StarshipParser:
         self.advance()
         return ASTNode("MISSION", mission_name, nodes)
 
+    def parse_sub_mission(self):
+        line = self.current_token.line
+        self.advance()
+
+        if self.kind != T_IDENTIFIER:
+            self.error("Expected SUB_MISSION name")
+        name = self.current_token.value
+        self.advance()
+
+        sections = []
+        while self.current_token and self.kind != KW_END_MISSION:
+            if self.kind == KW_REQUIRES:
+                self.advance()
+                sections.append(ASTNode("REQUIRES", None, self.parse_name_list()))
+            elif self.kind == KW_PROVIDES:
+                self.advance()
+                sections.append(ASTNode("PROVIDES", None, self.parse_name_list()))
+            elif self.kind == KW_CARGO:
+                sections.append(self.parse_cargo())
+            elif self.kind == KW_FLIGHT_PLAN:
+                sections.append(self.parse_flight_plan())
+            else:
+                self.error(f"Unexpected token in SUB_MISSION {name}")
+
+        if self.kind != KW_END_MISSION:
+            self.error(f"SUB_MISSION {name} must end with END_MISSION")
+        self.advance()
+
+        return ASTNode("SUB_MISSION", name, sections, line)
+
+    def parse_name_list(self):
+        names = []
+        while self.kind == T_IDENTIFIER:
+            names.append(ASTNode("IDENTIFIER", self.current_token.value))
+            self.advance()
+            if self.kind != T_COMMA:
+                break
+            self.advance()
+        return names
+
     def parse_cargo(self):
         self.advance()
         cargo_items = []
 
-        while self.current_token and self.current_token.type == "IDENTIFIER":
+        while self.kind == T_IDENTIFIER:
             name = self.current_token.value
+            line = self.current_token.line
             self.advance()
 
-            if self.current_token.value != "=":
+            if self.kind != T_ASSIGN:
                 self.error()
             self.advance()
 
             value = self.parse_expression()
 
-            if self.current_token.value != "as":
+            if self.kind != KW_AS:
                 self.error()
             self.advance()
 
@@ -97,6 +251,7 @@ class StarshipParser:
                     "CARGO_ITEM",
                     name,
                     [ASTNode("VALUE", value), ASTNode("TYPE", type_name)],
+                    line,
                 )
             )
 
@@ -106,11 +261,11 @@ class StarshipParser:
         self.advance()
         steps = []
 
-        while self.current_token and self.current_token.type == "NUMBER":
+        while self.kind == T_NUMBER:
             step_number = int(float(self.current_token.value))
             self.advance()
 
-            if self.current_token.type != "DOT":
+            if self.kind != T_DOT:
                 self.error("Expected '.' after step number")
             self.advance()
 
@@ -120,38 +275,26 @@ class StarshipParser:
         return ASTNode("FLIGHT_PLAN", "flight_plan_section", steps)
 
     def parse_step(self):
+        line = self.parse_step_number()
+        step = self.parse_command()
+        step.line = line
+        return step
+
+    def parse_step_number(self):
         if not self.current_token:
             self.error("Unexpected end of flight plan")
 
-        if self.current_token.type == "NUMBER":
+        if self.kind == T_NUMBER:
             self.advance()
-            if self.current_token.type == "DOT":
+            if self.kind == T_DOT:
                 self.advance()
 
-        if self.current_token.type == "KEYWORD":
-            if self.current_token.value == "BEAM":
-                return self.parse_beam_command()
-
-            elif self.current_token.value == "ORBIT":
-                return self.parse_orbit_command()
-
-            elif self.current_token.value == "DOCK":
-                return self.parse_operation_command("DOCK")
-
-            elif self.current_token.value == "UNDOCK":
-                return self.parse_operation_command("UNDOCK")
+        return self.current_token.line
 
-            elif self.current_token.value == "BOOST":
-                return self.parse_operation_command("BOOST")
-
-            elif self.current_token.value == "SPLIT":
-                return self.parse_operation_command("SPLIT")
-
-            elif self.current_token.value == "EXTRACT":
-                return self.parse_extract_command()
-
-            elif self.current_token.value == "APPEND":
-                return self.parse_append_command()
+    def parse_command(self):
+        command = self.commands.get(self.kind)
+        if command is not None:
+            return command()
 
         self.error(f"Unknown command: {self.current_token.value}")
 
@@ -159,43 +302,129 @@ class StarshipParser:
         self.advance()
         value = self.parse_expression()
 
-        if self.current_token.value != "to":
+        if self.kind != KW_LOWER_TO:
             self.error("Expected 'to' after BEAM value")
         self.advance()
 
-        if self.current_token.value != "DISPLAY":
+        if self.kind != KW_DISPLAY:
             self.error("Expected 'DISPLAY' after 'to'")
         self.advance()
 
         return ASTNode("BEAM", None, [value])
 
     def parse_orbit_command(self):
+        # An ORBIT's body takes every following step, so a nested ORBIT is
+        # always the last step of its parent and is parsed in this loop
+        # rather than by recursing once per level.
+        outer = None
+        orbit = None
+        line = 0
+        while True:
+            self.advance()
+            count = self.parse_expression()
+
+            if self.kind != KW_TIMES and self.kind != KW_TIMES_COLON:
+                self.error("Expected 'TIMES' after ORBIT count")
+            self.advance()
+
+            if self.kind == T_COLON:
+                self.advance()
+
+            nested = ASTNode("ORBIT", None, [count], line)
+            if orbit is None:
+                outer = nested
+            else:
+                orbit.children.append(nested)
+            orbit = nested
+
+            while self.kind == T_NUMBER:
+                line = self.parse_step_number()
+                if self.kind == KW_ORBIT:
+                    break
+                step = self.parse_command()
+                step.line = line
+                orbit.children.append(step)
+            else:
+                return outer
+
+    def parse_quantum_calculate_command(self):
         self.advance()
-        count = self.parse_expression()
+        samples = self.parse_expression()
+
+        body = []
+        while self.current_token and self.kind != KW_END_QUANTUM:
+            body.append(self.parse_step())
 
-        if self.current_token.value not in ["TIMES", "TIMES:"]:
-            self.error("Expected 'TIMES' after ORBIT count")
+        if self.kind != KW_END_QUANTUM:
+            self.error("Expected 'END_QUANTUM' after QUANTUM_CALCULATE body")
         self.advance()
 
-        if self.current_token.value == ":":
-            self.advance()
+        return ASTNode("QUANTUM_CALCULATE", None, [samples] + body)
 
-        body = []
-        while self.current_token and self.current_token.type == "NUMBER":
-            step = self.parse_step()
-            body.append(step)
+    def parse_stabilize_command(self):
+        self.advance()
+        value = self.parse_expression()
+
+        if self.kind != KW_INTO:
+            self.error("Expected 'INTO' after STABILIZE value")
+        self.advance()
 
-        return ASTNode("ORBIT", None, [count] + body)
+        targets = self.parse_expression_list()
+        return ASTNode("STABILIZE", None, [value] + targets)
+
+    def parse_store_command(self):
+        self.advance()
+        value = self.parse_expression()
+
+        if self.kind != KW_IN:
+            self.error("Expected 'IN' after STORE value")
+        self.advance()
+
+        return ASTNode("STORE", self.parse_store_key(), [value])
+
+    def parse_reduction_command(self, op_type):
+        self.advance()
+        source = self.parse_expression()
+
+        if self.kind != KW_INTO:
+            self.error(f"Expected 'INTO' after {op_type} value")
+        self.advance()
+
+        target = self.parse_expression()
+        return ASTNode(op_type, None, [source, target])
+
+    def parse_search_command(self, op_type):
+        self.advance()
+        value = self.parse_expression()
+
+        if self.kind != KW_IN:
+            self.error(f"Expected 'IN' after {op_type} value")
+        self.advance()
+        source = self.parse_expression()
+
+        if self.kind != KW_INTO:
+            self.error(f"Expected 'INTO' after {op_type} CONSTELLATION")
+        self.advance()
+
+        target = self.parse_expression()
+        return ASTNode(op_type, None, [value, source, target])
+
+    def parse_store_key(self):
+        if self.kind != T_IDENTIFIER and self.kind != T_STRING:
+            self.error("Expected storage key")
+        key = self.current_token.value
+        self.advance()
+        return key
 
     def parse_quantum(self):
         self.advance()
         quantum_items = []
 
-        while self.current_token and self.current_token.type == "IDENTIFIER":
+        while self.kind == T_IDENTIFIER:
             name = self.current_token.value
             self.advance()
 
-            if self.current_token.value != "=":
+            if self.kind != T_ASSIGN:
                 self.error()
             self.advance()
 
@@ -208,17 +437,17 @@ class StarshipParser:
         if self.current_token.value == "UNCERTAIN":
             self.advance()
 
-            if self.current_token.value != "(":
+            if self.kind != T_LPAREN:
                 self.error()
             self.advance()
             min_val = self.parse_expression()
 
-            if self.current_token.value != ",":
+            if self.kind != T_COMMA:
                 self.error()
             self.advance()
             max_val = self.parse_expression()
 
-            if self.current_token.value != ")":
+            if self.kind != T_RPAREN:
                 self.error()
             self.advance()
             return ASTNode("UNCERTAIN", None, [min_val, max_val])
@@ -226,54 +455,73 @@ class StarshipParser:
         self.error()
 
     def parse_expression(self):
-        if self.current_token.type == "NUMBER":
+        if self.kind == T_NUMBER:
             value = self.current_token.value
             self.advance()
             return ASTNode("NUMBER", value)
 
-        elif self.current_token.type == "MINUS":
+        elif self.kind == T_MINUS:
             self.advance()
 
-            if self.current_token.type == "NUMBER":
+            if self.kind == T_NUMBER:
                 value = -self.current_token.value
                 self.advance()
                 return ASTNode("NUMBER", value)
             self.error("Expected number after '-'")
 
-        elif self.current_token.type == "STRING":
+        elif self.kind == T_STRING:
             value = self.current_token.value
             self.advance()
             return ASTNode("STRING", value)
 
-        elif self.current_token.type == "IDENTIFIER":
+        elif self.kind == T_IDENTIFIER:
             value = self.current_token.value
+            line = self.current_token.line
             self.advance()
 
-            if self.current_token and self.current_token.value == "[":
+            if self.kind == T_LBRACKET:
                 self.advance()
-                index = self.parse_expression()
+                indices = [self.parse_index()]
+                if self.kind == T_COMMA:
+                    self.advance()
+                    indices.append(self.parse_index())
 
-                if not self.current_token or self.current_token.value != "]":
+                if self.kind != T_RBRACKET:
                     self.error("Expected ']'")
                 self.advance()
-                return ASTNode("ARRAY_ACCESS", value, [index])
+                return ASTNode("ARRAY_ACCESS", value, indices, line)
 
             return ASTNode("IDENTIFIER", value)
 
-        elif self.current_token.value == "[":
+        elif self.kind == T_LBRACKET:
             return self.parse_array()
+
+        elif self.kind == T_NUMBERS:
+            values = self.current_token.value
+            self.advance()
+            return ASTNode("NUMBERS", values)
+
+        elif self.kind == KW_IN:
+            self.advance()
+            return ASTNode("STORED", self.parse_store_key())
         self.error()
 
+    def parse_index(self):
+        if self.kind == T_COLON:
+            self.advance()
+            return ASTNode("SLICE", None)
+        return self.parse_expression()
+
     def parse_array(self):
         self.advance()
         elements = []
 
-        while self.current_token and self.current_token.value != "]":
+        while self.current_token and self.kind != T_RBRACKET:
             elements.append(self.parse_expression())
-            if self.current_token.value == ",":
+            if self.kind == T_COMMA:
                 self.advance()
 
-        if self.current_token.value != "]":
+        if self.kind != T_RBRACKET:
             self.error()
         self.advance()
 
@@ -281,8 +529,34 @@ class StarshipParser:
 
     def parse_launch_command(self):
         self.advance()
-        value = self.parse_expression()
-        return ASTNode("LAUNCH", None, [value])
+
+        if self.kind != T_IDENTIFIER:
+            self.error("Expected SUB_MISSION name after LAUNCH")
+        name = self.current_token.value
+        self.advance()
+
+        arguments = []
+        if self.kind == KW_LOWER_WITH:
+            self.advance()
+            arguments = self.parse_expression_list()
+
+        targets = []
+        if self.kind == KW_INTO:
+            self.advance()
+            targets = self.parse_expression_list()
+
+        return ASTNode(
+            "LAUNCH",
+            name,
+            [ASTNode("ARGUMENTS", None, arguments), ASTNode("TARGETS", None, targets)],
+        )
+
+    def parse_expression_list(self):
+        expressions = [self.parse_expression()]
+        while self.kind == T_COMMA:
+            self.advance()
+            expressions.append(self.parse_expression())
+        return expressions
 
     def parse_return_command(self):
         self.advance()
@@ -292,7 +566,7 @@ class StarshipParser:
         self.advance()
         source = self.parse_expression()
 
-        if self.current_token.value != "INTO":
+        if self.kind != KW_INTO:
             self.error("Expected 'INTO' after EXTRACT expression")
         self.advance()
 
@@ -303,13 +577,13 @@ class StarshipParser:
         self.advance()
         val1 = self.parse_expression()
 
-        if self.current_token.value != "with":
+        if self.kind != KW_LOWER_WITH:
             self.error("Expected 'with' after first DOCK value")
         self.advance()
 
         val2 = self.parse_expression()
 
-        if self.current_token.value != "INTO":
+        if self.kind != KW_INTO:
             self.error("Expected 'INTO' after second DOCK value")
         self.advance()
 
@@ -320,7 +594,7 @@ class StarshipParser:
         self.advance()
         value = self.parse_expression()
 
-        if self.current_token.value != "TO":
+        if self.kind != KW_TO:
             self.error("Expected 'TO' after APPEND value")
         self.advance()
 
@@ -331,13 +605,13 @@ class StarshipParser:
         self.advance()
         val1 = self.parse_expression()
 
-        if self.current_token.value != "with":
+        if self.kind != KW_LOWER_WITH:
             self.error(f"Expected 'with' after first {op_type} value")
         self.advance()
 
         val2 = self.parse_expression()
 
-        if self.current_token.value != "INTO":
+        if self.kind != KW_INTO:
             self.error(f"Expected 'INTO' after second {op_type} value")
         self.advance()
 
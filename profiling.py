@@ -0,0 +1,116 @@
+import json
+import sys
+from parser import ASTNode
+from linalg import is_bulk
+from buffers import QuantumBuffer
+
+
+def deep_size(value):
+    seen = set()
+    size = 0
+    stack = [value]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set)):
+            stack.extend(current)
+        elif isinstance(current, QuantumBuffer):
+            stack.append(current.items)
+        elif isinstance(current, ASTNode):
+            stack.append(current.__dict__)
+        elif is_bulk(current) and current.base is not None:
+            size += current.nbytes
+    return size
+
+
+class MemoryProfiler:
+    def __init__(self, interval=1000, top=10):
+        self.interval = interval
+        self.top = top
+        self.reset()
+
+    def reset(self):
+        self.countdown = self.interval
+        self.instructions = 0
+        self.ast_bytes = 0
+        self.timeline = []
+        self.peak_variables = {}
+        self.peak_output_bytes = 0
+        self.step_growth = {}
+        self.last_total = 0
+        self.previous = None
+
+    def start(self, runtime, ast):
+        self.reset()
+        self.ast_bytes = deep_size(ast)
+
+    def tick(self, runtime, node):
+        # Called before node runs: growth seen now is charged to the step
+        # that ran last.
+        self.countdown -= 1
+        if self.countdown <= 0:
+            self.countdown = self.interval
+            self.sample(runtime, self.previous)
+        self.instructions += 1
+        self.previous = node
+
+    def sample(self, runtime, node):
+        variables = {
+            name: deep_size(entry["value"]) for name, entry in runtime.variables.items()
+        }
+        output_bytes = deep_size(runtime.output_buffer)
+        total = sum(variables.values()) + output_bytes
+
+        for name, size in variables.items():
+            if size > self.peak_variables.get(name, 0):
+                self.peak_variables[name] = size
+        self.peak_output_bytes = max(self.peak_output_bytes, output_bytes)
+
+        line = node.line if node else None
+        step = node.type if node else None
+        growth = total - self.last_total
+        self.last_total = total
+        if growth > 0 and node is not None:
+            key = (line, step)
+            self.step_growth[key] = self.step_growth.get(key, 0) + growth
+
+        self.timeline.append(
+            {
+                "instruction": self.instructions,
+                "line": line,
+                "step": step,
+                "total_bytes": total,
+                "output_buffer_bytes": output_bytes,
+                "variables": variables,
+            }
+        )
+
+    def finish(self, runtime):
+        self.sample(runtime, self.previous)
+
+    def report(self):
+        top_steps = sorted(self.step_growth.items(), key=lambda item: -item[1])
+        return {
+            "interval": self.interval,
+            "instructions": self.instructions,
+            "ast_bytes": self.ast_bytes,
+            "peak_output_bytes": self.peak_output_bytes,
+            "peak_variable_bytes": dict(
+                sorted(self.peak_variables.items(), key=lambda item: -item[1])
+            ),
+            "top_steps": [
+                {"line": line, "step": step, "growth_bytes": growth}
+                for (line, step), growth in top_steps[: self.top]
+            ],
+            "timeline": self.timeline,
+        }
+
+    def to_json(self):
+        return json.dumps(self.report())
@@ -0,0 +1,97 @@
+import copy
+from types import MappingProxyType
+from errors import StarshipError
+from lexer import StarshipLexer
+from parser import StarshipParser, ASTNode
+from interpreter import StarshipRuntime, cargo_value
+from linalg import is_bulk
+from buffers import QuantumBuffer
+
+LITERAL_TYPES = {"NUMBER", "NUMBERS", "STRING", "ARRAY"}
+
+
+def is_literal(node):
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current.type not in LITERAL_TYPES:
+            return False
+        stack.extend(current.children)
+    return True
+
+
+def fresh(value):
+    # Mutable values are shared by every run of a Program, so each run gets
+    # its own copy.
+    if isinstance(value, QuantumBuffer):
+        return QuantumBuffer(value.capacity)
+    if isinstance(value, list):
+        if any(isinstance(item, list) for item in value):
+            return copy.deepcopy(value)
+        return list(value)
+    return value
+
+
+class CargoSlot:
+    __slots__ = ("name", "type", "line", "literal", "value")
+
+    def __init__(self, name, type_name, line, literal=False, value=None):
+        self.name = name
+        self.type = type_name
+        self.line = line
+        self.literal = literal
+        self.value = value
+
+
+class Program:
+    def __init__(self, source, ast):
+        self.source = source
+        self.ast = ast
+
+        # Literal CARGO values are evaluated once here; runs only copy them.
+        evaluator = StarshipRuntime(hot_loop_threshold=0)
+        slots = {}
+        for section in ast.children:
+            if section.type != "CARGO":
+                continue
+            for item in section.children:
+                value_node, type_node = item.children
+                slot = CargoSlot(item.value, type_node.value, item.line)
+                if is_literal(value_node.value):
+                    evaluator.execute_cargo(ASTNode("CARGO", section.value, [item]))
+                    slot.literal = True
+                    slot.value = evaluator.variables[item.value]["value"]
+                    if is_bulk(slot.value):
+                        slot.value.setflags(write=False)
+                slots[item.value] = slot
+        self.cargo = MappingProxyType(slots)
+
+    def prepare(self, overrides=None):
+        preset = {
+            name: fresh(slot.value) for name, slot in self.cargo.items() if slot.literal
+        }
+        for name, value in (overrides or {}).items():
+            slot = self.cargo.get(name)
+            if slot is None:
+                raise StarshipError(f"Mission has no CARGO named {name}", 0)
+            if isinstance(value, bool):
+                raise StarshipError(
+                    f"Override for {name} must be {slot.type}, got {value!r}", slot.line
+                )
+            try:
+                preset[name] = cargo_value(fresh(value), slot.type, slot.line)
+            except TypeError:
+                raise StarshipError(
+                    f"Override for {name} must be {slot.type}, got {value!r}", slot.line
+                )
+        return preset
+
+    def run(self, overrides=None, **options):
+        runtime = StarshipRuntime(**options)
+        runtime.execute(self.ast, self.prepare(overrides))
+        return runtime
+
+
+def compile(source):
+    tokens = StarshipLexer(source).tokenize()
+    return Program(source, StarshipParser(tokens).parse())
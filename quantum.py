@@ -0,0 +1,147 @@
+import math
+import operator
+import numpy as np
+from errors import StarshipError
+from buffers import QuantumBuffer
+
+
+def _undock(a, b):
+    difference = a - b
+    return difference if difference > 0 else 0
+
+
+def _split(a, b):
+    return a // b
+
+
+def _undock_samples(a, b):
+    return np.maximum(np.subtract(a, b), 0)
+
+
+SCALAR_OPERATIONS = {
+    "DOCK": operator.add,
+    "BOOST": operator.mul,
+    "UNDOCK": _undock,
+    "SPLIT": _split,
+}
+
+# Sample vectors are float64 arrays; scalars broadcast against them.
+VECTOR_OPERATIONS = {
+    "DOCK": np.add,
+    "BOOST": np.multiply,
+    "UNDOCK": _undock_samples,
+    "SPLIT": np.floor_divide,
+}
+
+
+def combine(op_type, val1, val2, line):
+    vector1 = isinstance(val1, np.ndarray)
+    vector2 = isinstance(val2, np.ndarray)
+
+    if op_type == "SPLIT" and ((val2 == 0).any() if vector2 else val2 == 0):
+        raise StarshipError("Cannot split by zero", line)
+
+    if not vector1 and not vector2:
+        return SCALAR_OPERATIONS[op_type](val1, val2)
+    return VECTOR_OPERATIONS[op_type](val1, val2)
+
+
+def quantile(ordered, fraction):
+    position = fraction * (len(ordered) - 1)
+    low = math.floor(position)
+    high = min(low + 1, len(ordered) - 1)
+    weight = position - low
+    return ordered[low] + (ordered[high] - ordered[low]) * weight
+
+
+# STABILIZE targets receive these statistics in order; quantiles are only
+# computed when a target asks for them, since they need a sort.
+STATISTICS = ("mean", "variance", "p05", "median", "p95")
+
+
+def stabilize(values, count, line):
+    size = len(values)
+    if size == 0:
+        raise StarshipError("Cannot STABILIZE an empty set of samples", line)
+
+    if isinstance(values, np.ndarray):
+        results = [float(values.mean())]
+        if count > 1:
+            results.append(float(values.var(ddof=1)) if size > 1 else 0.0)
+        if count > 2:
+            # Linear interpolation, like quantile() below, via a partition.
+            results.extend(np.quantile(values, (0.05, 0.5, 0.95)).tolist())
+        return results[:count]
+
+    if isinstance(values, QuantumBuffer):
+        results = [values.window_mean(), values.window_variance()]
+    else:
+        mean = math.fsum(values) / size
+        results = [mean]
+        if count > 1:
+            deviations = [value - mean for value in values]
+            squares = math.fsum(map(operator.mul, deviations, deviations))
+            results.append(squares / (size - 1) if size > 1 else 0.0)
+    if count > 2:
+        ordered = sorted(values)
+        results.extend(quantile(ordered, q) for q in (0.05, 0.5, 0.95))
+    return results[:count]
+
+
+class QuantumBlock:
+    def __init__(self, runtime, samples):
+        self.runtime = runtime
+        self.samples = samples
+        self.locals = {}
+        self.draws = {}
+        self.generator = None
+
+    def draw(self, name):
+        vector = self.draws.get(name)
+        if vector is not None:
+            return vector
+
+        quantum_node = self.runtime.quantum_space[name]
+        if quantum_node.type != "UNCERTAIN":
+            return self.runtime.evaluate_expression(quantum_node)
+
+        low = self.runtime.evaluate_expression(quantum_node.children[0])
+        high = self.runtime.evaluate_expression(quantum_node.children[1])
+        if self.generator is None:
+            # Seeded from the runtime's generator, so seeded runs and trace
+            # replays draw the same samples.
+            seed = self.runtime.random.getrandbits(64)
+            self.generator = np.random.default_rng(seed)
+        vector = self.generator.uniform(low, high, self.samples)
+        self.draws[name] = vector
+        return vector
+
+    def evaluate(self, expr):
+        if expr.type == "IDENTIFIER":
+            if expr.value in self.runtime.quantum_space:
+                return self.draw(expr.value)
+            if expr.value in self.locals:
+                return self.locals[expr.value]
+        return self.runtime.evaluate_expression(expr)
+
+    def execute(self, step):
+        if step.type == "EXTRACT":
+            self.locals[step.children[1].value] = self.evaluate(step.children[0])
+
+        elif step.type in VECTOR_OPERATIONS:
+            val1 = self.evaluate(step.children[0])
+            val2 = self.evaluate(step.children[1])
+            self.locals[step.children[2].value] = combine(
+                step.type, val1, val2, step.line
+            )
+
+        elif step.type == "STABILIZE":
+            values = self.evaluate(step.children[0])
+            if not isinstance(values, (list, np.ndarray)):
+                values = [values]
+            self.runtime.assign_statistics(values, step.children[1:], step.line)
+
+        else:
+            raise StarshipError(
+                f"{step.type} is not allowed inside QUANTUM_CALCULATE", step.line
+            )
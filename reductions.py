@@ -0,0 +1,147 @@
+from collections import OrderedDict
+import numpy as np
+from errors import StarshipError
+from linalg import is_bulk
+from buffers import QuantumBuffer
+from spill import SpilledConstellation
+
+REDUCTIONS = ("SUM", "MIN", "MAX", "SORT")
+SEARCHES = ("DETECTED", "SCAN")
+
+
+class ConstellationIndex:
+    __slots__ = ("values", "size", "lookups", "positions", "ordered", "results")
+
+    def __init__(self, values):
+        self.values = values
+        self.size = len(values)
+        self.lookups = 0
+        self.positions = None
+        self.ordered = None
+        self.results = {}
+
+    def valid(self, values):
+        # CONSTELLATIONs only ever grow, so an APPEND (interpreted or from a
+        # compiled ORBIT) always shows up as a length change.
+        return self.values is values and self.size == len(values)
+
+
+class ConstellationIndexes:
+    def __init__(self, build_after=2, max_entries=64):
+        self.build_after = build_after
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.builds = 0
+
+    def get(self, values):
+        key = id(values)
+        entry = self.entries.get(key)
+        if entry is not None and entry.valid(values):
+            self.entries.move_to_end(key)
+            return entry
+
+        entry = self.entries[key] = ConstellationIndex(values)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def reduce(self, op_type, values, line):
+        if not isinstance(values, list):
+            return reduce_native(op_type, values, line)
+        entry = self.get(values)
+        if op_type == "SORT":
+            if entry.ordered is None:
+                entry.ordered = sort_values(values, line)
+            return list(entry.ordered)
+        result = entry.results.get(op_type)
+        if result is None:
+            result = entry.results[op_type] = reduce_native(op_type, values, line)
+        return result
+
+    def find(self, values, value):
+        if not isinstance(values, list):
+            return find_native(values, value)
+        entry = self.get(values)
+        entry.lookups += 1
+        if entry.positions is None and entry.lookups >= self.build_after:
+            entry.positions = build_positions(values)
+            self.builds += 1
+        if entry.positions:
+            try:
+                return entry.positions.get(value, -1)
+            except TypeError:
+                # An unhashable value (a nested CONSTELLATION) can still
+                # match element by element.
+                pass
+        return find_native(values, value)
+
+
+def build_positions(values):
+    positions = {}
+    try:
+        for position in range(len(values) - 1, -1, -1):
+            positions[values[position]] = position
+    except TypeError:
+        # Unhashable elements (nested CONSTELLATIONs) keep using linear scans.
+        return False
+    return positions
+
+
+def sort_values(values, line):
+    try:
+        return sorted(values)
+    except TypeError:
+        raise StarshipError("Cannot SORT a CONSTELLATION of mixed types", line)
+
+
+def reduce_native(op_type, values, line):
+    if is_bulk(values):
+        if op_type == "SORT":
+            if values.ndim != 1:
+                raise StarshipError("SORT needs a CONSTELLATION or VECTOR", line)
+            return np.sort(values)
+        if values.size == 0 and op_type != "SUM":
+            raise StarshipError(f"Cannot {op_type} an empty VECTOR", line)
+        return float(getattr(values, op_type.lower())())
+
+    if isinstance(values, SpilledConstellation):
+        return values.reduce(op_type)
+    if isinstance(values, QuantumBuffer):
+        if op_type == "SUM":
+            return values.window_sum()
+        values = list(values)
+    elif not isinstance(values, list):
+        raise StarshipError(f"{op_type} needs a CONSTELLATION", line)
+
+    if op_type == "SORT":
+        return sort_values(values, line)
+    if op_type == "SUM":
+        try:
+            return sum(values)
+        except TypeError:
+            raise StarshipError("SUM needs a CONSTELLATION of numbers", line)
+    if not values:
+        raise StarshipError(f"Cannot {op_type} an empty CONSTELLATION", line)
+    try:
+        return min(values) if op_type == "MIN" else max(values)
+    except TypeError:
+        raise StarshipError(f"Cannot {op_type} a CONSTELLATION of mixed types", line)
+
+
+def find_native(values, value):
+    if is_bulk(values):
+        matches = (values.ravel() == value).nonzero()[0]
+        return int(matches[0]) if len(matches) else -1
+    if isinstance(values, SpilledConstellation):
+        return values.find(value)
+    if isinstance(values, QuantumBuffer):
+        # Positions count back from the newest entry, like EXTRACT.
+        for position in range(len(values)):
+            if values[position] == value:
+                return position
+        return -1
+    try:
+        return values.index(value)
+    except ValueError:
+        return -1
@@ -0,0 +1,207 @@
+import struct
+import sys
+from array import array
+from errors import StarshipError
+from parser import ASTNode, paused_gc
+
+MAGIC = b"SSAST"
+VERSION = 2
+# Version 1 files (no packed arrays) are still readable.
+SUPPORTED_VERSIONS = (1, 2)
+
+VALUE_NONE = 0
+VALUE_STRING = 1
+VALUE_INT = 2
+VALUE_FLOAT = 3
+VALUE_NODE = 4
+VALUE_PACKED = 5
+
+_double = struct.Struct("<d")
+
+
+def _write_varint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    byte = data[pos]
+    pos += 1
+    if byte < 0x80:
+        return byte, pos
+    result = byte & 0x7F
+    shift = 7
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def serialize(ast):
+    strings = {}
+    body = bytearray()
+    write = _write_varint
+
+    def intern(text):
+        index = strings.get(text)
+        if index is None:
+            index = strings[text] = len(strings)
+        return index
+
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        value = node.value
+        write(body, intern(node.type))
+
+        if value is None:
+            body.append(VALUE_NONE)
+        elif isinstance(value, str):
+            body.append(VALUE_STRING)
+            write(body, intern(value))
+        elif isinstance(value, bool):
+            raise StarshipError(f"Cannot serialize value {value!r}", node.line)
+        elif isinstance(value, int):
+            body.append(VALUE_INT)
+            write(body, value << 1 if value >= 0 else ((-value) << 1) - 1)
+        elif isinstance(value, float):
+            body.append(VALUE_FLOAT)
+            body += _double.pack(value)
+        elif isinstance(value, ASTNode):
+            body.append(VALUE_NODE)
+        elif isinstance(value, array):
+            body.append(VALUE_PACKED)
+            body.append(ord(value.typecode))
+            write(body, len(value))
+            if sys.byteorder == "big":
+                value = array(value.typecode, value)
+                value.byteswap()
+            body += value.tobytes()
+        else:
+            raise StarshipError(f"Cannot serialize value {value!r}", node.line)
+
+        write(body, node.line)
+        write(body, len(node.children))
+        stack.extend(reversed(node.children))
+        if isinstance(value, ASTNode):
+            stack.append(value)
+
+    out = bytearray(MAGIC)
+    out.append(VERSION)
+    write(out, len(strings))
+    for text in strings:
+        encoded = text.encode("utf-8")
+        write(out, len(encoded))
+        out += encoded
+    out += body
+    return bytes(out)
+
+
+def deserialize(data):
+    with paused_gc:
+        try:
+            return _deserialize(data)
+        except (IndexError, ValueError, struct.error) as e:
+            # Truncated or corrupt input runs off the end of the buffer or
+            # decodes garbage (bad UTF-8, array typecodes, table indexes).
+            raise StarshipError(f"Corrupt mission data: {e}", 0)
+
+
+def _deserialize(data):
+    if data[: len(MAGIC)] != MAGIC:
+        raise StarshipError("Not a serialized Starship mission", 0)
+    pos = len(MAGIC)
+    if data[pos] not in SUPPORTED_VERSIONS:
+        raise StarshipError(f"Unsupported mission format version {data[pos]}", 0)
+    pos += 1
+
+    read = _read_varint
+    count, pos = read(data, pos)
+    strings = []
+    for _ in range(count):
+        size, pos = read(data, pos)
+        strings.append(data[pos : pos + size].decode("utf-8"))
+        pos += size
+
+    new_node = ASTNode.__new__
+    root = None
+    # Each frame is [node, waiting_for_value_node, children_left].
+    stack = []
+    end = len(data)
+    while pos < end:
+        type_index = data[pos]
+        if type_index < 0x80:
+            pos += 1
+        else:
+            type_index, pos = read(data, pos)
+        tag = data[pos]
+        pos += 1
+
+        if tag == VALUE_NONE:
+            value = None
+        elif tag == VALUE_STRING:
+            index, pos = read(data, pos)
+            value = strings[index]
+        elif tag == VALUE_INT:
+            raw, pos = read(data, pos)
+            value = raw >> 1 if not raw & 1 else -((raw + 1) >> 1)
+        elif tag == VALUE_FLOAT:
+            value = _double.unpack_from(data, pos)[0]
+            pos += 8
+        elif tag == VALUE_NODE:
+            value = None
+        elif tag == VALUE_PACKED:
+            value = array(chr(data[pos]))
+            count, pos = read(data, pos + 1)
+            size = count * value.itemsize
+            value.frombytes(data[pos : pos + size])
+            if sys.byteorder == "big":
+                value.byteswap()
+            pos += size
+        else:
+            raise StarshipError(f"Corrupt mission data at byte {pos}", 0)
+
+        line = data[pos]
+        if line < 0x80:
+            pos += 1
+        else:
+            line, pos = read(data, pos)
+        child_count = data[pos]
+        if child_count < 0x80:
+            pos += 1
+        else:
+            child_count, pos = read(data, pos)
+
+        node = new_node(ASTNode)
+        node.type = strings[type_index]
+        node.value = value
+        node.children = []
+        node.line = line
+
+        if stack:
+            frame = stack[-1]
+            if frame[1]:
+                frame[0].value = node
+                frame[1] = False
+            else:
+                frame[0].children.append(node)
+                frame[2] -= 1
+        elif root is None:
+            root = node
+        else:
+            raise StarshipError(f"Corrupt mission data at byte {pos}", 0)
+
+        if tag == VALUE_NODE or child_count:
+            stack.append([node, tag == VALUE_NODE, child_count])
+        else:
+            while stack and not stack[-1][1] and not stack[-1][2]:
+                stack.pop()
+
+    if stack or root is None:
+        raise StarshipError("Truncated mission data", 0)
+    return root
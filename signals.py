@@ -0,0 +1,53 @@
+import sys
+
+# Shorter results are concatenated directly; a rope only pays off once
+# copying the text costs more than keeping its fragments.
+ROPE_MIN = 4096
+
+
+class SignalRope:
+    __slots__ = ("parts", "count", "length", "text")
+
+    def __init__(self, parts, count, length):
+        # Ropes share one parts list; each sees its first `count` fragments,
+        # so extending a rope never changes the SIGNAL an older one holds.
+        self.parts = parts
+        self.count = count
+        self.length = length
+        self.text = None
+
+    def dock(self, fragment):
+        parts = self.parts
+        if len(parts) != self.count:
+            parts = parts[: self.count]
+        parts.append(fragment)
+        return SignalRope(parts, self.count + 1, self.length + len(fragment))
+
+    def flat(self):
+        if self.text is None:
+            parts = self.parts
+            if len(parts) != self.count:
+                parts = parts[: self.count]
+            self.text = "".join(parts)
+        return self.text
+
+    def __str__(self):
+        return self.flat()
+
+    def __repr__(self):
+        return repr(self.flat())
+
+    def __len__(self):
+        return self.length
+
+    def __sizeof__(self):
+        fragments = sum(map(sys.getsizeof, self.parts[: self.count]))
+        return object.__sizeof__(self) + sys.getsizeof(self.parts) + fragments
+
+
+def dock_signals(left, right):
+    if type(left) is SignalRope:
+        return left.dock(right)
+    if len(left) + len(right) < ROPE_MIN:
+        return left + right
+    return SignalRope([left, right], 2, len(left) + len(right))
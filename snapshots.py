@@ -0,0 +1,271 @@
+import copy
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from buffers import QuantumBuffer
+from spill import SpilledConstellation
+from signals import SignalRope
+from serialization import serialize
+from submissions import freeze, walk, quantum_names
+from linalg import is_bulk
+
+DEFAULT_BUDGET = 64 << 20
+
+# Steps that read or write the persistent store depend on more than the
+# mission text, so the chain of snapshots stops before the first of them.
+EXTERNAL_NODES = {"STORE", "STORED"}
+
+# Nodes that draw from the random number generator, besides reads of
+# QUANTUM variables.
+RANDOM_NODES = {"UNCERTAIN", "QUANTUM_CALCULATE"}
+
+SHARED = 0
+PREFIX = 1
+COPIED = 2
+
+
+def mission_units(mission_node):
+    units = []
+    for node in mission_node.children:
+        if node.type == "FLIGHT_PLAN":
+            units.extend(node.children)
+        elif node.type in ("CARGO", "QUANTUM"):
+            units.append(node)
+    return units
+
+
+def contains(node, types):
+    return any(current.type in types for current in walk(node))
+
+
+def draws(node, quantum_names):
+    return any(
+        current.type in RANDOM_NODES
+        or current.type == "IDENTIFIER"
+        and current.value in quantum_names
+        for current in walk(node)
+    )
+
+
+def unit_keys(mission_node, units, cargo, seed, limits):
+    # Key i covers everything that can influence the state after unit i:
+    # the seed, limits, CARGO overrides, every SUB_MISSION and units 0..i.
+    digest = hashlib.sha256(repr(seed).encode("utf-8"))
+    digest.update(repr(sorted(vars(limits).items())).encode("utf-8"))
+    if cargo:
+        frozen = sorted((name, freeze(value)) for name, value in cargo.items())
+        digest.update(repr(frozen).encode("utf-8"))
+    # Without a seed every run has to draw fresh numbers, so the chain also
+    # stops before the first unit that draws one.
+    unseeded = seed is None
+    quantum = quantum_names(mission_node)
+    external = set(EXTERNAL_NODES)
+    for node in mission_node.children:
+        if node.type == "SUB_MISSION":
+            digest.update(serialize(node))
+            if contains(node, EXTERNAL_NODES):
+                external.add("LAUNCH")
+            if unseeded and draws(node, quantum):
+                external.add("LAUNCH")
+
+    keys = []
+    for unit in units:
+        if contains(unit, external):
+            break
+        if unseeded and unit.type != "QUANTUM" and draws(unit, quantum):
+            break
+        digest.update(serialize(unit))
+        keys.append(digest.digest())
+    return keys + [None] * (len(units) - len(keys))
+
+
+class SharedValue:
+    __slots__ = ("value", "length", "size", "nested", "refs")
+
+    def __init__(self, value):
+        self.value = value
+        self.length = 0
+        self.size = sys.getsizeof(value)
+        self.nested = False
+        self.refs = 0
+
+
+class Snapshot:
+    __slots__ = ("variables", "quantum_space", "random_state", "output", "usage")
+
+    def __init__(self, variables, quantum_space, random_state, output, usage):
+        self.variables = variables
+        self.quantum_space = quantum_space
+        self.random_state = random_state
+        self.output = output
+        self.usage = usage
+
+
+class SnapshotCache:
+    def __init__(self, max_bytes=DEFAULT_BUDGET):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.shared = {}
+        self.size = 0
+        self.hits = 0
+        self.lock = threading.Lock()
+
+    def share(self, value, items):
+        # Lists (and rope fragments) only ever grow, so a snapshot keeps the
+        # live object plus its current length instead of a copy; each new
+        # element is counted against the budget once.
+        record = self.shared.get(id(value))
+        if record is None:
+            record = self.shared[id(value)] = SharedValue(value)
+            self.size += record.size
+        length = len(items)
+        if length > record.length:
+            added = 0
+            for item in items[record.length : length]:
+                added += 8 + sys.getsizeof(item)
+                if type(item) is list:
+                    record.nested = True
+            record.length = length
+            record.size += added
+            self.size += added
+        record.refs += 1
+        return record
+
+    def release(self, record):
+        record.refs -= 1
+        if record.refs == 0:
+            del self.shared[id(record.value)]
+            self.size -= record.size
+
+    def capture(self, runtime):
+        variables = []
+        records = []
+        memo = {}
+        size = sys.getsizeof(runtime.variables)
+        entries = runtime.variables.items()
+        for _, entry in entries:
+            value = entry["value"]
+            if type(value) is SpilledConstellation:
+                # Its segment files go away with runtime.close().
+                for record in records:
+                    self.release(record)
+                return None, 0
+            if type(value) is list:
+                records.append(self.share(value, value))
+        # Inner CONSTELLATIONs can still be APPENDed to, possibly through
+        # another variable, so any nesting means every list is copied.
+        nested = any(record.nested for record in records)
+        lists = iter(records)
+        for name, entry in entries:
+            value = entry["value"]
+            value_type = type(value)
+            if value_type is list:
+                record = next(lists)
+                if nested:
+                    size += record.size
+                    variables.append(
+                        (name, entry["type"], COPIED, copy.deepcopy(value, memo))
+                    )
+                else:
+                    variables.append(
+                        (name, entry["type"], PREFIX, (record, len(value)))
+                    )
+            elif value_type is QuantumBuffer:
+                size += sys.getsizeof(value.items) + 32 * value.capacity
+                variables.append(
+                    (name, entry["type"], COPIED, copy.deepcopy(value, memo))
+                )
+            else:
+                if value_type is SignalRope:
+                    records.append(self.share(value.parts, value.parts))
+                elif is_bulk(value) or value_type is str:
+                    # Never modified in place; shared like a list.
+                    records.append(self.share(value, ()))
+                else:
+                    size += sys.getsizeof(value)
+                variables.append((name, entry["type"], SHARED, value))
+            size += 100
+        output = self.share(runtime.output_buffer, runtime.output_buffer)
+        records.append(output)
+        snapshot = Snapshot(
+            variables,
+            dict(runtime.quantum_space),
+            runtime.random.getstate(),
+            (output, len(runtime.output_buffer)),
+            runtime.usage.summary(),
+        )
+        return (snapshot, records), size
+
+    def take(self, runtime, key):
+        with self.lock:
+            captured, size = self.capture(runtime)
+            if captured is None:
+                return
+            if key in self.entries:
+                self.discard(key)
+            self.entries[key] = captured
+            self.sizes[key] = size
+            self.size += size
+            while self.size > self.max_bytes and self.entries:
+                self.discard(next(iter(self.entries)))
+
+    def discard(self, key):
+        _, records = self.entries.pop(key)
+        self.size -= self.sizes.pop(key)
+        for record in records:
+            self.release(record)
+
+    def restore(self, runtime, keys):
+        # Resume after the last unit whose prefix is unchanged; returns how
+        # many units to skip.
+        with self.lock:
+            for position in range(len(keys) - 1, -1, -1):
+                key = keys[position]
+                if key is None or key not in self.entries:
+                    continue
+                self.entries.move_to_end(key)
+                snapshot, _ = self.entries[key]
+                self.apply(runtime, snapshot)
+                self.hits += 1
+                return position + 1
+        return 0
+
+    def apply(self, runtime, snapshot):
+        # One memo for the whole snapshot keeps aliased CONSTELLATIONs
+        # (from EXTRACT) aliased after the restore.
+        variables = {}
+        memo = {}
+        for name, type_name, kind, payload in snapshot.variables:
+            if kind == PREFIX:
+                record, length = payload
+                value = memo.get(id(record))
+                if value is None:
+                    value = memo[id(record)] = record.value[:length]
+            elif kind == COPIED:
+                value = copy.deepcopy(payload, memo)
+            elif type(payload) is SignalRope:
+                # Runs restoring the same snapshot must not DOCK onto one
+                # shared parts list.
+                parts = payload.parts[: payload.count]
+                value = SignalRope(parts, payload.count, payload.length)
+            else:
+                value = payload
+            variables[name] = {"value": value, "type": type_name}
+        runtime.variables = variables
+        runtime.quantum_space = dict(snapshot.quantum_space)
+        if runtime.seed is not None:
+            # An unseeded prefix never drew a number, so the run keeps its
+            # own fresh generator.
+            runtime.random.setstate(snapshot.random_state)
+        record, length = snapshot.output
+        runtime.output_buffer = record.value[:length]
+        usage = runtime.usage
+        for field, value in snapshot.usage.items():
+            setattr(usage, field, value)
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                self.discard(key)
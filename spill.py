@@ -0,0 +1,283 @@
+import heapq
+import os
+import shutil
+import tempfile
+import weakref
+from collections import OrderedDict
+import numpy as np
+from errors import StarshipError
+
+CHUNK_SIZE = 1 << 20
+HOT_CHUNKS = 8
+FLUSH_SIZE = 1 << 14
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+
+def spill_dtype(values):
+    # Only CONSTELLATIONs of all-int or all-float METRICs fit a fixed-width
+    # segment; anything else stays a list.
+    if all(type(value) is int for value in values):
+        if values and (min(values) < INT64_MIN or max(values) > INT64_MAX):
+            return None
+        return np.dtype(np.int64)
+    if all(type(value) is float for value in values):
+        return np.dtype(np.float64)
+    return None
+
+
+class SpillStore:
+    def __init__(self, threshold, directory=None):
+        self.threshold = threshold
+        self.directory = directory
+        self.chunk_size = CHUNK_SIZE
+        self.hot_chunks = HOT_CHUNKS
+        self.path = None
+        self.hot = OrderedDict()
+        self.segments = 0
+        self.retry = {}
+        self.spilled = 0
+        self.closed = False
+
+    def spill(self, values):
+        key = id(values)
+        if len(values) < self.retry.get(key, 0):
+            return None
+        dtype = spill_dtype(values)
+        if dtype is None:
+            # Mixed CONSTELLATIONs are only rechecked after doubling in size.
+            self.retry[key] = 2 * len(values)
+            return None
+        self.retry.pop(key, None)
+        spilled = SpilledConstellation(self, dtype)
+        for start in range(0, len(values), FLUSH_SIZE):
+            spilled.tail = values[start : start + FLUSH_SIZE]
+            spilled.flush()
+        self.spilled += 1
+        return spilled
+
+    def segment(self):
+        if self.path is None:
+            self.path = tempfile.mkdtemp(prefix="starship-spill-", dir=self.directory)
+            self.closed = False
+            weakref.finalize(self, shutil.rmtree, self.path, True)
+        self.segments += 1
+        return os.path.join(self.path, f"{self.segments}.seg")
+
+    def chunk(self, path, dtype, create=False):
+        chunk = self.hot.get(path)
+        if chunk is not None:
+            self.hot.move_to_end(path)
+            return chunk
+        if not create and (self.closed or not os.path.exists(path)):
+            raise StarshipError(
+                "Spilled CONSTELLATION was removed when its runtime closed", 0
+            )
+        chunk = self.hot[path] = np.memmap(
+            path, dtype=dtype, mode="w+" if create else "r+", shape=(self.chunk_size,)
+        )
+        if len(self.hot) > self.hot_chunks:
+            # Unmapping writes the chunk back and frees its pages.
+            _, evicted = self.hot.popitem(last=False)
+            evicted.flush()
+        return chunk
+
+    def settle(self):
+        # Between runs spilled data lives only in the segment files.
+        for chunk in self.hot.values():
+            chunk.flush()
+        self.hot.clear()
+        self.retry.clear()
+
+    def cleanup(self):
+        self.hot.clear()
+        self.retry.clear()
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
+            self.closed = True
+
+
+class SpilledConstellation:
+    def __init__(self, store, dtype):
+        self.store = store
+        self.dtype = dtype
+        self.kind = int if dtype == np.int64 else float
+        self.segments = []
+        self.size = 0
+        self.tail = []
+
+    def accepts(self, value):
+        if type(value) is not self.kind:
+            return False
+        return self.kind is float or INT64_MIN <= value <= INT64_MAX
+
+    def append(self, value):
+        tail = self.tail
+        tail.append(value)
+        if len(tail) >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.tail:
+            return
+        data = np.array(self.tail, dtype=self.dtype)
+        self.tail = []
+        chunk_size = self.store.chunk_size
+        offset = 0
+        while offset < len(data):
+            index, start = divmod(self.size, chunk_size)
+            create = index == len(self.segments)
+            if create:
+                self.segments.append(self.store.segment())
+            chunk = self.store.chunk(self.segments[index], self.dtype, create)
+            count = min(chunk_size - start, len(data) - offset)
+            chunk[start : start + count] = data[offset : offset + count]
+            self.size += count
+            offset += count
+
+    def __len__(self):
+        return self.size + len(self.tail)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index >= self.size:
+            return self.tail[index - self.size]
+        segment, offset = divmod(index, self.store.chunk_size)
+        return self.store.chunk(self.segments[segment], self.dtype)[offset].item()
+
+    def blocks(self):
+        # Flushed data in FLUSH_SIZE pieces, copied out of the mapped chunks
+        # so an eviction cannot invalidate them.
+        chunk_size = self.store.chunk_size
+        for index, path in enumerate(self.segments):
+            count = min(chunk_size, self.size - index * chunk_size)
+            for start in range(0, count, FLUSH_SIZE):
+                chunk = self.store.chunk(path, self.dtype)
+                yield np.array(chunk[start : min(start + FLUSH_SIZE, count)])
+
+    def __iter__(self):
+        for block in self.blocks():
+            yield from block.tolist()
+        yield from list(self.tail)
+
+    def __str__(self):
+        return "[" + ", ".join(map(repr, self)) + "]"
+
+    __repr__ = __str__
+
+    def copy(self):
+        self.flush()
+        copied = SpilledConstellation(self.store, self.dtype)
+        for block in self.blocks():
+            copied.tail = block.tolist()
+            copied.flush()
+        return copied
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __reduce__(self):
+        # Sent to another process as a plain list.
+        return list, (list(self),)
+
+    def __add__(self, other):
+        if not isinstance(other, (list, SpilledConstellation)):
+            return NotImplemented
+        return self.concat(self, other)
+
+    def __radd__(self, other):
+        if not isinstance(other, list):
+            return NotImplemented
+        return self.concat(other, self)
+
+    def __mul__(self, count):
+        if not isinstance(count, int):
+            return NotImplemented
+        return list(self) * count
+
+    __rmul__ = __mul__
+
+    def concat(self, left, right):
+        # A DOCK of two CONSTELLATIONs stays on disk when every value fits
+        # this segment type, and falls back to a list otherwise.
+        parts = (left, right)
+        for part in parts:
+            if type(part) is SpilledConstellation:
+                fits = part.dtype == self.dtype
+            else:
+                fits = all(map(self.accepts, part))
+            if not fits:
+                return list(left) + list(right)
+        result = SpilledConstellation(self.store, self.dtype)
+        for part in parts:
+            if type(part) is SpilledConstellation:
+                part.flush()
+                blocks = (block.tolist() for block in part.blocks())
+            else:
+                blocks = (
+                    part[start : start + FLUSH_SIZE]
+                    for start in range(0, len(part), FLUSH_SIZE)
+                )
+            for block in blocks:
+                result.tail = block
+                result.flush()
+        return result
+
+    def discard(self):
+        for path in self.segments:
+            self.store.hot.pop(path, None)
+            os.remove(path)
+        self.segments = []
+        self.size = 0
+
+    def reduce(self, op_type):
+        self.flush()
+        if op_type == "SUM":
+            # Same left-to-right order as sum() on a list, so float totals
+            # match an in-memory CONSTELLATION exactly.
+            total = 0
+            for block in self.blocks():
+                total = sum(block.tolist(), total)
+            return total
+        if op_type == "SORT":
+            return self.sorted()
+        pick = np.min if op_type == "MIN" else np.max
+        return pick([pick(block) for block in self.blocks()]).item()
+
+    def sorted(self):
+        # External merge sort: sort each chunk into its own run, then merge
+        # the runs block by block into a new spilled CONSTELLATION.
+        runs = []
+        chunk_size = self.store.chunk_size
+        for index in range(len(self.segments)):
+            run = SpilledConstellation(self.store, self.dtype)
+            count = min(chunk_size, self.size - index * chunk_size)
+            chunk = self.store.chunk(self.segments[index], self.dtype)
+            run.tail = np.sort(chunk[:count]).tolist()
+            run.flush()
+            runs.append(run)
+        ordered = SpilledConstellation(self.store, self.dtype)
+        for value in heapq.merge(*runs):
+            ordered.append(value)
+        ordered.flush()
+        for run in runs:
+            run.discard()
+        return ordered
+
+    def find(self, value):
+        if not isinstance(value, (int, float)):
+            return -1
+        if self.kind is int and isinstance(value, int):
+            if not INT64_MIN <= value <= INT64_MAX:
+                return -1
+        self.flush()
+        offset = 0
+        for block in self.blocks():
+            matches = np.flatnonzero(block == value)
+            if len(matches):
+                return offset + int(matches[0])
+            offset += len(block)
+        return -1
@@ -0,0 +1,104 @@
+import json
+import os
+import sqlite3
+import threading
+from errors import StarshipError
+from linalg import is_bulk
+from buffers import QuantumBuffer
+from spill import SpilledConstellation
+
+# One store per installation rather than per working directory;
+# STARSHIP_DATA_DIR moves it elsewhere.
+DATA_DIR = os.environ.get("STARSHIP_DATA_DIR") or os.path.dirname(
+    os.path.abspath(__file__)
+)
+DEFAULT_STORE_PATH = os.path.join(DATA_DIR, "starship_store.db")
+
+SCALAR = 0
+ENCODED = 1
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS cargo (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL,
+    kind INTEGER NOT NULL,
+    value
+)"""
+
+INDEX = "CREATE INDEX IF NOT EXISTS cargo_key ON cargo (key, id)"
+
+# sqlite3 connections may only be used by the thread that opened them, so the
+# pool keeps one connection per store path for each worker thread.
+_pool = threading.local()
+
+
+def connect(path):
+    connections = getattr(_pool, "connections", None)
+    if connections is None:
+        connections = _pool.connections = {}
+
+    connection = connections.get(path)
+    if connection is None:
+        connection = sqlite3.connect(path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(SCHEMA)
+        connection.execute(INDEX)
+        connection.commit()
+        connections[path] = connection
+    return connection
+
+
+def close_all():
+    connections = getattr(_pool, "connections", {})
+    for connection in connections.values():
+        connection.close()
+    connections.clear()
+
+
+def encode(value, line):
+    if isinstance(value, bool):
+        raise StarshipError(f"Cannot STORE value {value!r}", line)
+    if isinstance(value, (int, float, str)):
+        return SCALAR, value
+    if is_bulk(value):
+        value = value.tolist()
+    elif isinstance(value, (QuantumBuffer, SpilledConstellation)):
+        value = list(value)
+    try:
+        return ENCODED, json.dumps(value)
+    except (TypeError, ValueError):
+        raise StarshipError(f"Cannot STORE value {value!r}", line)
+
+
+def decode(kind, value):
+    return json.loads(value) if kind == ENCODED else value
+
+
+class StarshipStore:
+    def __init__(self, path=DEFAULT_STORE_PATH, batch_size=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = []
+
+    def put(self, key, value, line):
+        kind, encoded = encode(value, line)
+        self.pending.append((key, kind, encoded))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        connection = connect(self.path)
+        with connection:
+            connection.executemany(
+                "INSERT INTO cargo (key, kind, value) VALUES (?, ?, ?)", self.pending
+            )
+        self.pending = []
+
+    def get_all(self, key):
+        self.flush()
+        rows = connect(self.path).execute(
+            "SELECT kind, value FROM cargo WHERE key = ? ORDER BY id", (key,)
+        )
+        return [decode(kind, value) for kind, value in rows]
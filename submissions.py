@@ -0,0 +1,123 @@
+import copy
+from collections import OrderedDict
+from parser import ASTNode
+from linalg import is_bulk
+from buffers import QuantumBuffer
+from spill import SpilledConstellation
+
+# Nodes that touch state outside the sub-mission (display output, the
+# persistent store or the random number generator); any of them makes the
+# sub-mission impure and uncacheable.
+IMPURE_INSTRUCTIONS = {"BEAM", "STORE", "STORED", "UNCERTAIN"}
+
+# Values that APPEND changes in place.
+MUTABLE_TYPES = (list, SpilledConstellation, QuantumBuffer)
+
+
+class StarshipSubMission:
+    def __init__(self, node):
+        self.name = node.value
+        self.line = node.line
+        self.requires = []
+        self.provides = []
+        self.sections = []
+
+        for child in node.children:
+            if child.type == "REQUIRES":
+                self.requires = [name.value for name in child.children]
+            elif child.type == "PROVIDES":
+                self.provides = [name.value for name in child.children]
+            else:
+                self.sections.append(child)
+
+
+def walk(node):
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        yield current
+        stack.extend(current.children)
+        if isinstance(current.value, ASTNode):
+            stack.append(current.value)
+
+
+def quantum_names(mission_node):
+    return {
+        item.value
+        for node in mission_node.children
+        if node.type == "QUANTUM"
+        for item in node.children
+    }
+
+
+def is_pure(name, sub_missions, quantum_names, visiting=None):
+    sub_mission = sub_missions.get(name)
+    if sub_mission is None:
+        return False
+
+    visiting = visiting if visiting else set()
+    if name in visiting:
+        return False
+    visiting.add(name)
+
+    for section in sub_mission.sections:
+        for node in walk(section):
+            if node.type in IMPURE_INSTRUCTIONS:
+                return False
+            if node.type in ("IDENTIFIER", "ARRAY_ACCESS") and (
+                node.value in quantum_names
+            ):
+                return False
+            if node.type == "LAUNCH" and not is_pure(
+                node.value, sub_missions, quantum_names, visiting
+            ):
+                return False
+
+    visiting.discard(name)
+    return True
+
+
+def freeze(value):
+    if isinstance(value, (list, SpilledConstellation)):
+        return ("list", tuple(freeze(item) for item in value))
+    if is_bulk(value):
+        return ("ndarray", value.shape, value.tobytes())
+    if isinstance(value, QuantumBuffer):
+        return ("buffer", value.capacity, tuple(value))
+    return (type(value).__name__, value)
+
+
+def detach(value):
+    if isinstance(value, MUTABLE_TYPES):
+        return copy.deepcopy(value)
+    return value
+
+
+class LaunchCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        # Callers may APPEND to what they get back, so neither side of the
+        # cache ever shares a mutable value with a variable.
+        results, cost = entry
+        return tuple(detach(value) for value in results), cost
+
+    def put(self, key, results, cost):
+        # `cost` is what running the LAUNCH charged the meter: instructions
+        # and the largest CONSTELLATION it built.
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = (tuple(detach(value) for value in results), cost)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
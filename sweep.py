@@ -0,0 +1,260 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from errors import StarshipError
+from lexer import StarshipLexer
+from parser import StarshipParser
+from program import Program
+from serialization import serialize, deserialize
+
+PENDING = 0
+DONE = 1
+FAILED = 2
+
+META_FILE = "sweep.json"
+VALUES_FILE = "values.npy"
+STATUS_FILE = "status.npy"
+
+CHUNK_SIZE = 256
+
+
+def grid(**axes):
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*axes.values())]
+
+
+def to_number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return math.nan
+    try:
+        return float(value)
+    except OverflowError:
+        return math.inf if value > 0 else -math.inf
+
+
+class SweepResult:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as handle:
+            meta = json.load(handle)
+        self.fingerprint = meta["fingerprint"]
+        self.params = meta["params"]
+        self.collect = meta["collect"]
+        self.values = np.load(os.path.join(path, VALUES_FILE), mmap_mode="r")
+        self.status = np.load(os.path.join(path, STATUS_FILE), mmap_mode="r")
+
+    @property
+    def complete(self):
+        return not (self.status == PENDING).any()
+
+    def pending(self):
+        return np.flatnonzero(self.status == PENDING)
+
+    def column(self, name):
+        return self.values[:, self.collect.index(name)]
+
+    def order(self, by):
+        keys = by if isinstance(by, (list, tuple)) else [by]
+        return sorted(
+            range(len(self.params)),
+            key=lambda run: tuple(self.params[run][key] for key in keys),
+        )
+
+    def outputs(self):
+        # Each worker appends to its own file; a run retried after a crash
+        # may appear twice, so the last record wins.
+        records = {}
+        for name in sorted(os.listdir(self.path)):
+            if not name.startswith("outputs-"):
+                continue
+            with open(os.path.join(self.path, name)) as handle:
+                for line in handle:
+                    record = json.loads(line)
+                    records[record["run"]] = record
+        return records
+
+    def rows(self, sort_by=None):
+        runs = self.order(sort_by) if sort_by else range(len(self.params))
+        for run in runs:
+            yield self.params[run], dict(zip(self.collect, self.values[run])), int(
+                self.status[run]
+            )
+
+
+def create(path, fingerprint, params, collect):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, META_FILE), "w") as handle:
+        json.dump(
+            {"fingerprint": fingerprint, "params": params, "collect": collect}, handle
+        )
+    values = np.lib.format.open_memmap(
+        os.path.join(path, VALUES_FILE),
+        mode="w+",
+        dtype=np.float64,
+        shape=(len(params), len(collect)),
+    )
+    values[:] = math.nan
+    values.flush()
+    status = np.lib.format.open_memmap(
+        os.path.join(path, STATUS_FILE), mode="w+", dtype=np.int8, shape=(len(params),)
+    )
+    status.flush()
+
+
+_worker = {}
+
+
+def _init_worker(ast_data, path, collect, options):
+    ast = deserialize(ast_data)
+    _worker["program"] = Program(None, ast)
+    _worker["collect"] = collect
+    _worker["options"] = options
+    # Both arrays are memory-mapped with MAP_SHARED: every worker writes its
+    # rows straight into the same pages, and they survive a crash.
+    _worker["values"] = np.load(os.path.join(path, VALUES_FILE), mmap_mode="r+")
+    _worker["status"] = np.load(os.path.join(path, STATUS_FILE), mmap_mode="r+")
+    _worker["outputs"] = os.path.join(path, f"outputs-{os.getpid()}.jsonl")
+
+
+def _run_chunk(chunk):
+    program = _worker["program"]
+    collect = _worker["collect"]
+    options = _worker["options"]
+    values = _worker["values"]
+    status = _worker["status"]
+
+    finished = []
+    records = []
+    for run, overrides in chunk:
+        error = None
+        try:
+            runtime = program.run(overrides, seed=run, **options)
+        except StarshipError as e:
+            error = e.message
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        if error is None:
+            variables = runtime.variables
+            values[run] = [
+                to_number(variables[name]["value"]) if name in variables else math.nan
+                for name in collect
+            ]
+            if runtime.output_buffer:
+                records.append({"run": run, "output": runtime.output_buffer})
+        else:
+            records.append({"run": run, "error": error})
+        finished.append((run, DONE if error is None else FAILED))
+
+    if records:
+        with open(_worker["outputs"], "a") as handle:
+            handle.write("".join(json.dumps(record) + "\n" for record in records))
+    values.flush()
+    for run, state in finished:
+        status[run] = state
+    status.flush()
+    return len(finished)
+
+
+def sweep(source, params, path, collect=None, workers=None, resume=False, **options):
+    ast = StarshipParser(StarshipLexer(source).tokenize()).parse()
+    ast_data = serialize(ast)
+    fingerprint = zlib.crc32(ast_data)
+    # Round-trip through JSON so the grid compares equal to the saved one.
+    params = json.loads(json.dumps([dict(overrides) for overrides in params]))
+
+    if collect is None:
+        collect = [
+            name
+            for name, slot in Program(source, ast).cargo.items()
+            if slot.type == "METRIC"
+        ]
+
+    if resume and os.path.exists(os.path.join(path, META_FILE)):
+        result = SweepResult(path)
+        if (
+            result.fingerprint != fingerprint
+            or result.params != params
+            or result.collect != list(collect)
+        ):
+            raise StarshipError(
+                f"Sweep in {path} was started with a different mission or grid", 0
+            )
+    else:
+        create(path, fingerprint, params, list(collect))
+        result = SweepResult(path)
+
+    pending = result.pending()
+    chunks = [
+        [(int(run), params[run]) for run in pending[start : start + CHUNK_SIZE]]
+        for start in range(0, len(pending), CHUNK_SIZE)
+    ]
+    options.setdefault("store_path", ":memory:")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(ast_data, path, list(collect), options),
+    ) as pool:
+        for _ in pool.map(_run_chunk, chunks):
+            pass
+    return SweepResult(path)
+
+
+def parse_axis(text):
+    name, _, spec = text.partition("=")
+    if not spec:
+        raise argparse.ArgumentTypeError(f"Expected name=values, got {text}")
+    if ":" in spec:
+        bounds = [int(part) for part in spec.split(":")]
+        return name, list(range(*bounds))
+    return name, [json.loads(value) for value in spec.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run a Starship mission over a grid of CARGO values."
+    )
+    parser.add_argument("mission", help="mission source file")
+    parser.add_argument("out", help="result directory")
+    parser.add_argument(
+        "--grid",
+        action="append",
+        type=parse_axis,
+        default=[],
+        help="axis as name=start:stop[:step] or name=v1,v2,... (repeatable)",
+    )
+    parser.add_argument("--params", help="JSON file with a list of CARGO overrides")
+    parser.add_argument("--collect", help="comma-separated METRIC variables to collect")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument(
+        "--sort", help="print results sorted by these comma-separated parameters"
+    )
+    args = parser.parse_args(argv)
+
+    with open(args.mission) as handle:
+        source = handle.read()
+    if args.params:
+        with open(args.params) as handle:
+            params = json.load(handle)
+    else:
+        params = grid(**dict(args.grid))
+    collect = args.collect.split(",") if args.collect else None
+
+    result = sweep(
+        source, params, args.out, collect, workers=args.workers, resume=args.resume
+    )
+    failed = int((result.status == FAILED).sum())
+    print(f"{len(result.params)} runs, {failed} failed, results in {args.out}")
+    if args.sort:
+        for overrides, values, state in result.rows(args.sort.split(",")):
+            print(json.dumps(overrides), json.dumps(values), state)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import random
+import pytest
+from errors import StarshipError
+from lexer import StarshipLexer
+from parser import StarshipParser
+from serialization import MAGIC, VERSION, serialize, deserialize
+
+NODE_TYPES = {
+    "MISSION",
+    "CARGO",
+    "CARGO_ITEM",
+    "QUANTUM",
+    "QUANTUM_ITEM",
+    "FLIGHT_PLAN",
+    "SUB_MISSION",
+    "REQUIRES",
+    "PROVIDES",
+    "VALUE",
+    "TYPE",
+    "NUMBER",
+    "NUMBERS",
+    "STRING",
+    "IDENTIFIER",
+    "ARRAY",
+    "ARRAY_ACCESS",
+    "SLICE",
+    "UNCERTAIN",
+    "STORED",
+    "BEAM",
+    "ORBIT",
+    "DOCK",
+    "UNDOCK",
+    "BOOST",
+    "SPLIT",
+    "EXTRACT",
+    "APPEND",
+    "LAUNCH",
+    "ARGUMENTS",
+    "TARGETS",
+    "RETURN",
+    "QUANTUM_CALCULATE",
+    "STABILIZE",
+    "STORE",
+    "SUM",
+    "MIN",
+    "MAX",
+    "SORT",
+    "DETECTED",
+    "SCAN",
+}
+
+
+def number(rng):
+    return rng.choice(
+        [
+            str(rng.randrange(1000)),
+            str(-rng.randrange(1, 1000)),
+            str(rng.randrange(1 << 70)),
+            repr(rng.uniform(-1e6, 1e6)),
+            f"{rng.randrange(1, 10)}e{rng.randrange(-5, 5)}",
+        ]
+    )
+
+
+def value(rng, packed=True):
+    choice = rng.randrange(5 if packed else 4)
+    if choice == 0:
+        return number(rng)
+    if choice == 1:
+        return f'"{rng.choice(["", "signal", "naïve ✓", "a b"])}"'
+    if choice == 2:
+        return rng.choice(["x", "total", "readings"])
+    if choice == 3:
+        # Mixed arrays are never packed.
+        items = [number(rng), '"s"'] + [number(rng) for _ in range(rng.randrange(3))]
+        return "[" + ", ".join(items) + "]"
+    return "[" + ", ".join(number(rng) for _ in range(rng.randrange(1, 6))) + "]"
+
+
+def expression(rng, packed=True):
+    choice = rng.randrange(5)
+    if choice == 0:
+        return "m[1]"
+    if choice == 1:
+        return f"m[:, {rng.randrange(3)}]"
+    if choice == 2:
+        return "IN readings"
+    return value(rng, packed)
+
+
+def step(rng, packed=True):
+    e = lambda: expression(rng, packed)
+    return rng.choice(
+        [
+            lambda: f"BEAM {e()} to DISPLAY",
+            lambda: f"{rng.choice(['DOCK', 'UNDOCK', 'BOOST', 'SPLIT'])} x with {e()} INTO y",
+            lambda: f"EXTRACT {e()} INTO y",
+            lambda: f"APPEND {e()} TO xs",
+            lambda: "LAUNCH Square with 3, x INTO a, b",
+            lambda: "RETURN",
+            lambda: f"STABILIZE {e()} INTO mean, variance",
+            lambda: f"STORE {e()} IN readings",
+            lambda: f"{rng.choice(['SUM', 'MIN', 'MAX', 'SORT'])} xs INTO t",
+            lambda: f"{rng.choice(['DETECTED', 'SCAN'])} {e()} IN xs INTO t",
+            lambda: "QUANTUM_CALCULATE: 100\n BOOST u with u INTO v\n END_QUANTUM",
+        ]
+    )()
+
+
+def plan(rng, packed=True):
+    steps = [step(rng, packed) for _ in range(rng.randrange(1, 8))]
+    if rng.random() < 0.5:
+        # An ORBIT takes every following step.
+        steps.insert(rng.randrange(len(steps)), f"ORBIT {rng.randrange(5)} TIMES:")
+    return "".join(f"        {k + 1}. {text}\n" for k, text in enumerate(steps))
+
+
+def mission(rng, packed=True):
+    cargo = "".join(
+        f"        c{k} = {value(rng, packed)} as "
+        f"{rng.choice(['METRIC', 'SIGNAL', 'CONSTELLATION', 'VECTOR'])}\n"
+        for k in range(rng.randrange(1, 4))
+    )
+    return (
+        "MISSION: Fuzz\n"
+        f"    CARGO:\n{cargo}"
+        "    QUANTUM:\n"
+        f"        u = UNCERTAIN({number(rng)}, {number(rng)})\n"
+        "    SUB_MISSION: Square\n"
+        "        REQUIRES: x, y\n"
+        "        PROVIDES: a, b\n"
+        f"        FLIGHT_PLAN:\n{plan(rng, packed)}"
+        "    END_MISSION\n"
+        f"    FLIGHT_PLAN:\n{plan(rng, packed)}"
+        "END_MISSION"
+    )
+
+
+def parse(source):
+    return StarshipParser(StarshipLexer(source).tokenize()).parse()
+
+
+def node_types(node, found):
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        found.add(current.type)
+        stack.extend(current.children)
+        if hasattr(current.value, "children"):
+            stack.append(current.value)
+    return found
+
+
+def missions(seed, count, packed=True):
+    rng = random.Random(seed)
+    return [parse(mission(rng, packed)) for _ in range(count)]
+
+
+def test_round_trip_covers_every_node_type():
+    found = set()
+    for ast in missions(0, 300):
+        data = serialize(ast)
+        assert deserialize(data) == ast
+        assert serialize(deserialize(data)) == data
+        node_types(ast, found)
+    assert found == NODE_TYPES
+
+
+def test_version_1_payloads_still_load():
+    for ast in missions(1, 100, packed=False):
+        assert "NUMBERS" not in node_types(ast, set())
+        data = bytearray(serialize(ast))
+        data[len(MAGIC)] = 1
+        assert deserialize(bytes(data)) == ast
+
+
+def test_deep_orbit_nesting_round_trips():
+    steps = "".join(f"        {k + 1}. ORBIT 1 TIMES:\n" for k in range(5000))
+    ast = parse(
+        f"MISSION: Deep\n    FLIGHT_PLAN:\n{steps}        5001. RETURN\nEND_MISSION"
+    )
+    assert serialize(deserialize(serialize(ast))) == serialize(ast)
+
+
+def test_truncated_input_is_rejected():
+    for ast in missions(2, 20):
+        data = serialize(ast)
+        for end in range(len(data)):
+            with pytest.raises(StarshipError):
+                deserialize(data[:end])
+
+
+def test_bad_header_is_rejected():
+    data = serialize(missions(3, 1)[0])
+    with pytest.raises(StarshipError, match="Not a serialized"):
+        deserialize(b"XXXXX" + data[len(MAGIC) :])
+    with pytest.raises(StarshipError, match="Unsupported"):
+        deserialize(MAGIC + bytes([VERSION + 1]) + data[len(MAGIC) + 1 :])
+
+
+def test_corrupt_input_fails_cleanly():
+    rng = random.Random(4)
+    for ast in missions(4, 50):
+        data = serialize(ast)
+        for _ in range(100):
+            corrupt = bytearray(data)
+            for _ in range(rng.randrange(1, 4)):
+                corrupt[rng.randrange(len(MAGIC) + 1, len(corrupt))] = rng.randrange(
+                    256
+                )
+            try:
+                deserialize(bytes(corrupt))
+            except StarshipError:
+                pass
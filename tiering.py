@@ -0,0 +1,302 @@
+from errors import StarshipError
+from spill import SpilledConstellation
+from signals import SignalRope, dock_signals
+
+COMPILABLE_TYPES = (int, float, str, list, SpilledConstellation)
+CONSTELLATION_TYPES = (list, SpilledConstellation)
+
+
+class Uncompilable(Exception):
+    pass
+
+
+class OrbitCompiler:
+    def __init__(self, body, variables, quantum_space):
+        self.body = body
+        self.variables = variables
+        self.quantum_space = quantum_space
+        self.slots = {}
+        self.entry_types = {}
+        self.types = {}
+        self.assigned = []
+        self.constellations = set()
+        self.lines = []
+
+    def slot(self, name):
+        if name not in self.slots:
+            if name in self.quantum_space:
+                raise Uncompilable(f"{name} is a QUANTUM variable")
+            entry = self.variables.get(name)
+            value_type = None if entry is None else type(entry["value"])
+            if value_type is SignalRope:
+                # SIGNAL slots hold either; DOCK builds ropes and every
+                # other use flattens them with str().
+                value_type = str
+            if value_type not in COMPILABLE_TYPES:
+                raise Uncompilable(f"{name} has no compilable value")
+            self.slots[name] = f"v{len(self.slots)}"
+            self.entry_types[name] = value_type
+            self.types[name] = value_type
+        return self.slots[name]
+
+    def assign(self, name, value_type):
+        slot = self.slot(name)
+        if name not in self.assigned:
+            self.assigned.append(name)
+        self.types[name] = value_type
+        return slot
+
+    def emit(self, line, depth=2):
+        self.lines.append("    " * depth + line)
+
+    def bail(self, position, depth=3):
+        # Leave the compiled loop after `position` body instructions of the
+        # current iteration; the interpreter runs the rest.
+        self.emit(f"usage.instructions += {position}", depth)
+        self.emit(f"position = {position}", depth)
+        self.emit("break", depth)
+
+    def operand(self, expr):
+        if expr.type == "NUMBER" and type(expr.value) in (int, float):
+            return repr(expr.value), type(expr.value)
+        if expr.type == "STRING":
+            return repr(expr.value), str
+        if expr.type == "IDENTIFIER":
+            return self.slot(expr.value), self.types[expr.value]
+        raise Uncompilable(f"{expr.type} operand")
+
+    def compile_extract(self, instruction, position):
+        source = instruction.children[0]
+        target = instruction.children[1].value
+
+        if source.type != "ARRAY_ACCESS":
+            value, value_type = self.operand(source)
+            self.emit(f"{self.assign(target, value_type)} = {value}")
+            return
+
+        if len(source.children) != 1 or source.children[0].type == "SLICE":
+            raise Uncompilable("multi-dimensional access")
+        array = self.slot(source.value)
+        if self.types[source.value] not in CONSTELLATION_TYPES:
+            raise Uncompilable(f"{source.value} is not a CONSTELLATION")
+        index, index_type = self.operand(source.children[0])
+        if index_type not in (int, float):
+            raise Uncompilable("non-numeric index")
+
+        self.slot(target)
+        expected = self.types[target]
+        slot = self.assign(target, expected)
+        self.emit(f"at = {position}")
+        self.emit(f"index = int({index})")
+        self.emit(f"if index < 0 or index >= len({array}):")
+        self.emit(
+            "raise StarshipError(f'Array index {index} out of range for array "
+            f"of size {{len({array})}}', {source.line})",
+            3,
+        )
+        self.emit(f"{slot} = {array}[index]")
+        self.emit(f"if type({slot}) is not {expected.__name__}:")
+        self.bail(position)
+
+    def compile_arithmetic(self, instruction, position):
+        val1, type1 = self.operand(instruction.children[0])
+        val2, type2 = self.operand(instruction.children[1])
+        target = instruction.children[2].value
+        op_type = instruction.type
+        line = instruction.line
+
+        numeric = type1 in (int, float) and type2 in (int, float)
+        if numeric:
+            result_type = float if float in (type1, type2) else int
+        elif op_type == "DOCK" and type1 is type2 and type1 in (str, list):
+            result_type = type1
+        else:
+            raise Uncompilable(f"{op_type} of {type1.__name__}/{type2.__name__}")
+
+        slot = self.assign(target, result_type)
+        if op_type == "BOOST":
+            self.emit(f"{slot} = {val1} * {val2}")
+        elif op_type == "DOCK" and result_type is str:
+            self.emit(f"{slot} = dock_signals({val1}, str({val2}))")
+        elif op_type == "DOCK" and result_type is list:
+            self.emit(f"at = {position}")
+            self.emit(f"size = len({val1}) + len({val2})")
+            self.emit("if size > usage.peak_constellation_size:")
+            self.emit(f"meter.constellation(size, {line})", 3)
+            self.emit(f"{slot} = {val1} + {val2}")
+        elif op_type == "DOCK":
+            self.emit(f"{slot} = {val1} + {val2}")
+        elif op_type == "SPLIT":
+            self.emit(f"at = {position}")
+            self.emit(f"if {val2} == 0:")
+            self.emit(f"raise StarshipError('Cannot split by zero', {line})", 3)
+            self.emit(f"{slot} = {val1} // {val2}")
+        else:
+            # max(0, x) keeps the int 0 whenever x is not positive.
+            self.emit(f"{slot} = {val1} - {val2}")
+            self.emit(f"if not {slot} > 0:")
+            self.emit(f"{slot} = 0", 3)
+            if result_type is float:
+                self.bail(position, 3)
+
+    def compile_append(self, instruction, position):
+        value, value_type = self.operand(instruction.children[0])
+        if value_type is str:
+            value = f"str({value})"
+        target = instruction.children[1].value
+        array = self.slot(target)
+        if self.types[target] not in CONSTELLATION_TYPES:
+            raise Uncompilable(f"{target} is not a CONSTELLATION")
+        self.constellations.add(target)
+        spilled = self.types[target] is SpilledConstellation
+        self.emit(f"at = {position}")
+        if spilled:
+            # The interpreter reports values the disk store cannot hold.
+            self.emit(f"if not {array}.accepts({value}):")
+            self.bail(position - 1)
+        self.emit(f"{array}.append({value})")
+        self.emit(f"size = len({array})")
+        self.emit("if size > usage.peak_constellation_size:")
+        self.emit(f"meter.constellation(size, {instruction.line})", 3)
+        if not spilled:
+            # Past the spill threshold the interpreter's next APPEND moves
+            # the list to disk.
+            self.emit("if size > spill_limit:")
+            self.bail(position)
+
+    def compile_beam(self, instruction, position):
+        value, _ = self.operand(instruction.children[0])
+        self.emit(f"at = {position}")
+        self.emit(f"emit(str({value}), {instruction.line})")
+
+    def generate(self):
+        for position, instruction in enumerate(self.body, 1):
+            if instruction.type == "EXTRACT":
+                self.compile_extract(instruction, position)
+            elif instruction.type in ("BOOST", "DOCK", "UNDOCK", "SPLIT"):
+                self.compile_arithmetic(instruction, position)
+            elif instruction.type == "APPEND":
+                self.compile_append(instruction, position)
+            elif instruction.type == "BEAM":
+                self.compile_beam(instruction, position)
+            else:
+                raise Uncompilable(f"{instruction.type} instruction")
+
+        if self.types != self.entry_types:
+            raise Uncompilable("variable types change across iterations")
+
+        body_size = len(self.body)
+        # lines[at] is the line of body instruction `at`; 0 means before
+        # the first one.
+        lines = [self.body[0].line] + [instruction.line for instruction in self.body]
+        source = ["def orbit(runtime, remaining):"]
+        source.append("    variables = runtime.variables")
+        for name, slot in self.slots.items():
+            source.append(f"    entry = variables.get({name!r})")
+            guard = f"entry is None or type(entry['value']) is not {self.entry_types[name].__name__}"
+            if self.entry_types[name] is str:
+                guard = "entry is None or type(entry['value']) not in (str, SignalRope)"
+            if name in self.constellations:
+                guard += " or entry['type'] != 'CONSTELLATION'"
+            source.append(f"    if {guard}:")
+            source.append("        return 0, None")
+            source.append(f"    {slot} = entry['value']")
+        source.extend(
+            [
+                "    meter = runtime.meter",
+                "    usage = meter.usage",
+                "    emit = runtime.emit",
+                "    limit = meter.limits.max_instructions",
+                "    spill = runtime.spill",
+                "    spill_limit = spill.threshold if spill is not None else inf",
+                "    if limit is not None:",
+                f"        remaining = min(remaining, (limit - usage.instructions) // {body_size})",
+                "    done = 0",
+                "    position = None",
+                "    at = 0",
+                "    try:",
+                "        while done < remaining:",
+            ]
+        )
+        source.extend("    " + line for line in self.lines)
+        source.extend(
+            [
+                f"            usage.instructions += {body_size}",
+                "            done += 1",
+                "    except StarshipError:",
+                "        # Charge the instructions of the failing iteration.",
+                "        usage.instructions += at",
+                "        runtime.orbit_progress = (done, at)",
+                "        raise",
+                "    except Exception as e:",
+                "        usage.instructions += at",
+                "        runtime.orbit_progress = (done, at)",
+                f"        raise StarshipError(str(e), {tuple(lines)!r}[at])",
+                "    finally:",
+            ]
+        )
+        for name in self.assigned:
+            slot = self.slots[name]
+            source.append(
+                f"        variables[{name!r}] = "
+                f"{{'value': {slot}, 'type': cargo_type({slot})}}"
+            )
+        if not self.assigned:
+            source.append("        pass")
+        source.append("    return done, position")
+        return "\n".join(source)
+
+
+def compile_orbit(body, runtime, cargo_type):
+    try:
+        source = OrbitCompiler(
+            body, runtime.variables, runtime.quantum_space
+        ).generate()
+    except Uncompilable:
+        return None
+    namespace = {
+        "StarshipError": StarshipError,
+        "cargo_type": cargo_type,
+        "inf": float("inf"),
+        "SpilledConstellation": SpilledConstellation,
+        "SignalRope": SignalRope,
+        "dock_signals": dock_signals,
+    }
+    exec(compile(source, "<orbit>", "exec"), namespace)
+    return namespace["orbit"]
+
+
+class OrbitTiers:
+    def __init__(self, threshold=1000, max_deoptimizations=3):
+        self.threshold = threshold
+        self.max_deoptimizations = max_deoptimizations
+        self.counters = {}
+        self.functions = {}
+        self.deoptimizations = {}
+        self.blocked = set()
+
+    def compiled(self, orbit_node):
+        return self.functions.get(id(orbit_node))
+
+    def observe(self, orbit_node, runtime, cargo_type):
+        key = id(orbit_node)
+        if key in self.blocked:
+            return
+        count = self.counters.get(key, 0) + 1
+        self.counters[key] = count
+        if count < self.threshold:
+            return
+
+        function = compile_orbit(orbit_node.children[1:], runtime, cargo_type)
+        if function is None:
+            self.blocked.add(key)
+        else:
+            self.functions[key] = function
+
+    def deoptimize(self, orbit_node):
+        key = id(orbit_node)
+        self.functions.pop(key, None)
+        self.counters[key] = 0
+        self.deoptimizations[key] = self.deoptimizations.get(key, 0) + 1
+        if self.deoptimizations[key] >= self.max_deoptimizations:
+            self.blocked.add(key)
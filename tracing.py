@@ -0,0 +1,359 @@
+import json
+import os
+import random
+import struct
+import zlib
+from collections import namedtuple
+from errors import StarshipError
+from serialization import serialize, _write_varint, _read_varint
+from buffers import QuantumBuffer
+from signals import SignalRope
+from spill import SpilledConstellation
+from linalg import is_bulk
+
+MAGIC = b"SSTRC"
+# Version 2 adds the CARGO the run was started with.
+VERSION = 2
+
+OUTCOME_SUCCESS = 0
+OUTCOME_ERROR = 1
+OUTCOME_FAILURE = 2
+
+_crc = struct.Struct("<I")
+
+# `count` back-to-back ORBIT iterations that executed the same `events`.
+Run = namedtuple("Run", ["count", "events"])
+
+
+def index_nodes(ast):
+    indices = {}
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        indices[id(node)] = len(indices)
+        stack.extend(reversed(node.children))
+        if hasattr(node.value, "children"):
+            stack.append(node.value)
+    return indices
+
+
+def fingerprint(ast):
+    return zlib.crc32(serialize(ast))
+
+
+def plain(value):
+    if isinstance(value, QuantumBuffer):
+        return [value.capacity, list(value)]
+    if is_bulk(value):
+        return value.tolist()
+    if isinstance(value, SignalRope):
+        return value.flat()
+    if isinstance(value, (list, SpilledConstellation)):
+        return [plain(item) for item in value]
+    return value
+
+
+def encode_cargo(cargo):
+    return [(name, json.dumps(plain(value))) for name, value in (cargo or {}).items()]
+
+
+def decode_cargo(encoded, ast):
+    # Values go back through their CARGO item's declared type, so VECTORs
+    # and MATRIXes come back as arrays.
+    from interpreter import cargo_value
+
+    items = {
+        item.value: item
+        for section in ast.children
+        if section.type == "CARGO"
+        for item in section.children
+    }
+    cargo = {}
+    for name, text in encoded:
+        value = json.loads(text)
+        item = items.get(name)
+        if item is None:
+            cargo[name] = value
+            continue
+        type_name = item.children[1].value
+        if type_name == "QUANTUM_BUFFER":
+            capacity, values = value
+            value = QuantumBuffer(capacity)
+            for entry in values:
+                value.append(entry)
+        else:
+            value = cargo_value(value, type_name, item.line)
+        cargo[name] = value
+    return cargo
+
+
+class OrbitFrame:
+    __slots__ = ("parent", "runs", "current")
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.runs = []
+        self.current = []
+
+
+class Trace:
+    def __init__(self, fingerprint, seed, inputs, events, outcome, cargo=()):
+        self.fingerprint = fingerprint
+        self.seed = seed
+        self.inputs = inputs
+        self.events = events
+        self.outcome = outcome
+        self.cargo = cargo
+
+    def steps(self):
+        return _count_steps(self.events)
+
+    def to_bytes(self):
+        out = bytearray(MAGIC)
+        out.append(VERSION)
+        out += _crc.pack(self.fingerprint)
+        _write_varint(out, self.seed)
+        _write_varint(out, len(self.inputs))
+        for encoded in self.inputs:
+            _write_string(out, encoded)
+        _write_varint(out, len(self.cargo))
+        for name, encoded in self.cargo:
+            _write_string(out, name)
+            _write_string(out, encoded)
+        _write_events(out, self.events)
+
+        kind, line, message = self.outcome
+        out.append(kind)
+        if kind != OUTCOME_SUCCESS:
+            _write_varint(out, line)
+            _write_string(out, message)
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[: len(MAGIC)] != MAGIC:
+            raise StarshipError("Not a Starship execution trace", 0)
+        pos = len(MAGIC)
+        version = data[pos]
+        if version not in (1, VERSION):
+            raise StarshipError(f"Unsupported trace format version {version}", 0)
+        pos += 1
+        (crc,) = _crc.unpack_from(data, pos)
+        pos += _crc.size
+        seed, pos = _read_varint(data, pos)
+
+        count, pos = _read_varint(data, pos)
+        inputs = []
+        for _ in range(count):
+            encoded, pos = _read_string(data, pos)
+            inputs.append(encoded)
+        cargo = []
+        if version >= 2:
+            count, pos = _read_varint(data, pos)
+            for _ in range(count):
+                name, pos = _read_string(data, pos)
+                encoded, pos = _read_string(data, pos)
+                cargo.append((name, encoded))
+        events, pos = _read_events(data, pos)
+
+        kind = data[pos]
+        pos += 1
+        line = message = None
+        if kind != OUTCOME_SUCCESS:
+            line, pos = _read_varint(data, pos)
+            message, pos = _read_string(data, pos)
+        return cls(crc, seed, inputs, events, (kind, line, message), cargo)
+
+    def save(self, path):
+        with open(path, "wb") as handle:
+            handle.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as handle:
+            return cls.from_bytes(handle.read())
+
+
+def _write_string(out, text):
+    encoded = text.encode("utf-8")
+    _write_varint(out, len(encoded))
+    out += encoded
+
+
+def _read_string(data, pos):
+    size, pos = _read_varint(data, pos)
+    return bytes(data[pos : pos + size]).decode("utf-8"), pos + size
+
+
+def _write_events(out, events):
+    # A step is its node index shifted left; a Run sets the low bit and is
+    # followed by the number of events in one iteration.
+    _write_varint(out, len(events))
+    for event in events:
+        if type(event) is int:
+            _write_varint(out, event << 1)
+        else:
+            _write_varint(out, (event.count << 1) | 1)
+            _write_events(out, event.events)
+
+
+def _read_events(data, pos):
+    count, pos = _read_varint(data, pos)
+    events = []
+    for _ in range(count):
+        raw, pos = _read_varint(data, pos)
+        if raw & 1:
+            inner, pos = _read_events(data, pos)
+            events.append(Run(raw >> 1, tuple(inner)))
+        else:
+            events.append(raw >> 1)
+    return events, pos
+
+
+def _count_steps(events):
+    total = 0
+    for event in events:
+        if type(event) is int:
+            total += 1
+        else:
+            total += event.count * _count_steps(event.events)
+    return total
+
+
+def outcome_of(error):
+    if error is None:
+        return OUTCOME_SUCCESS, None, None
+    if isinstance(error, StarshipError):
+        return OUTCOME_ERROR, error.line or 0, error.message
+    return OUTCOME_FAILURE, getattr(error, "line", None) or 0, str(error)
+
+
+class TraceRecorder:
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = int.from_bytes(os.urandom(8), "little")
+        self.seed = seed
+        self.indices = {}
+        self.fingerprint = 0
+        self.inputs = []
+        self.cargo = []
+        self.events = []
+        self.current = self.events
+        self.frame = None
+
+    def start(self, runtime, ast, cargo=None):
+        self.indices = index_nodes(ast)
+        self.fingerprint = fingerprint(ast)
+        self.inputs = []
+        self.cargo = encode_cargo(cargo)
+        self.events = []
+        self.current = self.events
+        self.frame = None
+        runtime.random = random.Random(self.seed)
+
+    def step(self, node):
+        self.current.append(self.indices[id(node)])
+
+    def stored(self, key, store):
+        values = store.get_all(key)
+        self.inputs.append(json.dumps(values))
+        return values
+
+    def begin_orbit(self):
+        self.frame = OrbitFrame(self.frame)
+        self.current = self.frame.current
+
+    def iteration(self):
+        frame = self.frame
+        events = tuple(frame.current)
+        frame.current.clear()
+        runs = frame.runs
+        if runs and runs[-1][1] == events:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, events])
+
+    def compiled(self, nodes, count, position):
+        # Steps run by a compiled ORBIT body, which skips step(): `count`
+        # whole iterations, then the first `position` nodes of the next one.
+        if count:
+            for node in nodes:
+                self.step(node)
+            self.iteration()
+            self.frame.runs[-1][0] += count - 1
+        for node in nodes[:position]:
+            self.step(node)
+
+    def end_orbit(self):
+        frame = self.frame
+        if frame.current:
+            self.iteration()
+        self.frame = frame.parent
+        self.current = self.frame.current if self.frame else self.events
+        for count, events in frame.runs:
+            if count == 1:
+                self.current.extend(events)
+            else:
+                self.current.append(Run(count, events))
+
+    def trace(self, error=None):
+        return Trace(
+            self.fingerprint,
+            self.seed,
+            self.inputs,
+            self.events,
+            outcome_of(error),
+            self.cargo,
+        )
+
+
+class TraceReplayer(TraceRecorder):
+    def __init__(self, trace):
+        super().__init__(trace.seed)
+        self.recorded = trace
+
+    def start(self, runtime, ast, cargo=None):
+        super().start(runtime, ast, cargo)
+        self.pending = iter(self.recorded.inputs)
+
+    def stored(self, key, store):
+        encoded = next(self.pending, None)
+        if encoded is None:
+            raise StarshipError(f"Trace has no recorded value for IN {key}", 0)
+        self.inputs.append(encoded)
+        return json.loads(encoded)
+
+    def verify(self, error=None):
+        replayed = self.trace(error)
+        if replayed.events != self.recorded.events:
+            raise StarshipError(
+                f"Replay diverged from the trace (replayed {replayed.steps()} "
+                f"steps, recorded {self.recorded.steps()})",
+                0,
+            )
+        if replayed.outcome != self.recorded.outcome:
+            raise StarshipError(
+                f"Replay ended with {replayed.outcome[2] or 'success'}, "
+                f"trace recorded {self.recorded.outcome[2] or 'success'}",
+                0,
+            )
+        return replayed
+
+
+def replay(trace, ast, **options):
+    # Imported here: the runtime itself only talks to recorders.
+    from interpreter import StarshipRuntime
+
+    if fingerprint(ast) != trace.fingerprint:
+        raise StarshipError("Trace was recorded for a different mission", 0)
+    options.setdefault("store_path", ":memory:")
+    runtime = StarshipRuntime(recorder=TraceReplayer(trace), **options)
+    error = None
+    try:
+        runtime.execute(ast, decode_cargo(trace.cargo, ast))
+    except Exception as e:
+        error = e
+    runtime.recorder.verify(error)
+    if error is not None:
+        raise error
+    return runtime